@@ -1,10 +1,16 @@
 import atexit
-from flask import Flask, render_template, request, jsonify, g
+import json
+import threading
+import time
+import uuid
+from flask import Flask, render_template, request, jsonify, g, Response, stream_with_context
 from flask_cors import CORS
 import os
 from common import model
 from chatbot import Chatbot
 from characters import developer_role, instruction
+from memory_manager import chat_writer, ensure_indexes
+from session_manager import SessionManager
 # dotenv 설정 로드
 from dotenv import load_dotenv
 load_dotenv()
@@ -12,20 +18,70 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app)
 
-# 전역 챗봇 인스턴스 (상태를 저장하지 않으므로 하나만 있으면 됨)
-# api_type 파라미터 추가: "responses" (기본값) 또는 "assistant" 선택 가능
-# assistant_id: 기존 Assistant를 사용할 경우 ID 지정
-chatbot = Chatbot(
-    model=model, 
-    developer_role=developer_role, 
-    instruction=instruction, 
-    user='브라이언', 
-    assistant='테오',
-    api_type="assistant",
-    #api_type="responses"  # "responses" 또는 "assistant" 선택
-    # assistant_id="asst_xxx"  # Assistant API 사용 시 기존 Assistant ID (선택사항)
+SESSION_COOKIE = "sid"
+
+# 세션마다 별도의 챗봇 인스턴스(컨텍스트, MemoryManager)를 사용
+# api_type 파라미터: "responses" (기본값) 또는 "assistant" 선택 가능
+# assistant_id: 기존 Assistant를 사용할 경우 ID 지정 (없으면 첫 세션에서 만든 Assistant를 재사용)
+assistant_id = os.getenv("OPENAI_ASSISTANT_ID")
+
+def create_chatbot(session_id):
+    global assistant_id
+    chatbot = Chatbot(
+        model=model, 
+        developer_role=developer_role, 
+        instruction=instruction, 
+        user='브라이언', 
+        assistant='테오',
+        api_type="assistant",
+        #api_type="responses"  # "responses" 또는 "assistant" 선택
+        assistant_id=assistant_id,
+        run_background=False,
+        session_id=session_id
+    )
+    if chatbot.api_type == "assistant":
+        assistant_id = chatbot.openai_assistant.id
+    return chatbot
+
+sessions = SessionManager(
+    create_chatbot,
+    max_sessions=int(os.getenv("MAX_SESSIONS", "100")),
+    max_total_messages=int(os.getenv("MAX_TOTAL_MESSAGES", "20000")),
+    idle_timeout=int(os.getenv("SESSION_IDLE_TIMEOUT", "1800"))
 )
 
+# 세션별 대화 복원(session_id + date) 조회용 인덱스
+try:
+    ensure_indexes()
+except Exception:
+    import traceback; traceback.print_exc()
+
+def background_task():
+    """오래 쓰지 않은 세션 정리 (기억 생성은 memory_worker.py가 별도 프로세스로 담당)"""
+    while True:
+        time.sleep(3600)     # 1시간마다 반복
+        sessions.evict()
+
+bg_thread = threading.Thread(target=background_task)
+bg_thread.daemon = True
+bg_thread.start()
+
+def current_chatbot():
+    """요청의 세션 쿠키로 챗봇 인스턴스를 찾음 (없으면 새 세션 발급)"""
+    session_id = request.cookies.get(SESSION_COOKIE)
+    if not session_id:
+        session_id = uuid.uuid4().hex
+        g.new_session_id = session_id
+    g.chatbot = sessions.get(session_id)
+    return g.chatbot
+
+@app.after_request
+def _set_session_cookie(response):
+    session_id = g.get("new_session_id")
+    if session_id:
+        response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite="Lax")
+    return response
+
 @app.route("/")
 def index():
     return render_template("chat.html")
@@ -40,7 +96,7 @@ def chat():
         return jsonify({"ok": False, "error": "메시지를 입력해주세요."}), 400
     
     # 챗봇으로 메시지 처리
-    resp = chatbot.chat(message, previous_response_id)
+    resp = current_chatbot().chat(message, previous_response_id)
     
     try:
         reply = resp.output[-1].content[0].text
@@ -55,23 +111,37 @@ def chat():
         "response_id": response_id
     })
 
+@app.post("/chat/stream")
+def chat_stream():
+    """응답 델타를 NDJSON(한 줄에 JSON 이벤트 하나)으로 흘려보내는 스트리밍 채팅"""
+    data = request.get_json(force=True)
+    message = (data or {}).get("message", "").strip()
+    previous_response_id = (data or {}).get("previous_response_id")
+
+    if not message:
+        return jsonify({"ok": False, "error": "메시지를 입력해주세요."}), 400
+
+    chatbot = current_chatbot()
+
+    def generate():
+        for event in chatbot.chat_stream(message, previous_response_id):
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @atexit.register
 def shutdown():
-    """서버 종료 시 대화 내용 저장"""
+    """서버 종료 시 저장 대기열을 비워 대화 내용 저장 (실패가 계속되면 spool 파일로 남김)"""
     try:
-        chatbot.save_chat()
+        chat_writer.close()
+        sessions.close()
         print("Chat history saved on shutdown.")
     except Exception:
        import traceback; traceback.print_exc()
 
-@app.teardown_appcontext
-def _persist_on_teardown(exc):
-    # 너무 자주 쓰기 싫다면 내부에서 'dirty' 플래그로 조건부 저장
-    try:
-        chatbot.save_chat()
-        print("Chat history saved on teardown.")
-    except Exception:
-        import traceback; traceback.print_exc()
-
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5070")), debug=True)
@@ -0,0 +1,125 @@
+import json
+import queue
+import threading
+import time
+
+_FLUSH = object()
+_STOP = object()
+
+FLUSH_TIMEOUT = 10    # flush 대기 상한(초) - Mongo 장애 시 호출한 스레드가 멈추지 않도록
+
+
+class ChatWriter:
+    """대화 메시지를 큐에 모았다가 백그라운드 스레드에서 insert_many로 묶어 저장하는 write-behind 저장소
+
+    - batch_size개가 모이거나 첫 메시지 이후 flush_interval초가 지나면 한 번에 저장
+    - 저장에 실패하면 백오프하며 max_tries회까지 재시도하고, 그래도 실패하면 spool_path 파일에 남겨 유실을 막음
+      (장애가 이어지는 동안에는 다음 묶음부터 한 번만 시도하고 바로 spool - 대기열이 메모리에 쌓이지 않도록)
+    - 저장이 끝난 메시지마다 on_saved 콜백을 호출 (대화 버퍼의 저장 워터마크 전진)
+    """
+
+    def __init__(self, collection, batch_size: int = 100, flush_interval: float = 1.0, spool_path: str = 'unsaved_chats.jsonl', max_tries: int = 5):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spool_path = spool_path
+        self.max_tries = max_tries
+        self.outage = False    # 직전 묶음을 저장하지 못하고 spool 했는지
+        self.queue = queue.Queue()
+        self.pending = 0
+        self.cond = threading.Condition()
+        self.thread = None
+        self.closing = False
+
+    def enqueue(self, doc: dict, on_saved=None):
+        """저장할 문서를 대기열에 넣음 (요청 스레드는 Mongo를 기다리지 않음)"""
+        with self.cond:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='chat-writer', daemon=True)
+                self.thread.start()
+            self.pending += 1
+        self.queue.put((doc, on_saved))
+
+    def flush(self, timeout: float = FLUSH_TIMEOUT) -> bool:
+        """대기 중인 메시지를 바로 저장하도록 요청하고 최대 timeout초 동안 기다림 (모두 저장됐으면 True)"""
+        if timeout is None:
+            timeout = FLUSH_TIMEOUT
+        if self.thread is None:
+            return True
+        self.queue.put(_FLUSH)
+        with self.cond:
+            return self.cond.wait_for(lambda: self.pending == 0, timeout=timeout)
+
+    def close(self, timeout: float = None):
+        """남은 메시지를 모두 저장하고 스레드를 종료 (서버 종료 시) - 저장하지 못한 메시지는 spool"""
+        if self.thread is None:
+            return
+        self.closing = True
+        self.queue.put(_STOP)
+        self.thread.join(timeout)
+
+    def _run(self):
+        batch = []
+        started = None
+        while True:
+            timeout = None if not batch else max(0, started + self.flush_interval - time.time())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = _FLUSH
+
+            if item is _STOP:
+                # 큐에 남은 메시지까지 모두 저장하고 종료
+                while True:
+                    try:
+                        item = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not _FLUSH and item is not _STOP:
+                        batch.append(item)
+                if batch:
+                    self._write(batch)
+                return
+
+            if item is not _FLUSH:
+                if not batch:
+                    started = time.time()
+                batch.append(item)
+            if batch and (item is _FLUSH or len(batch) >= self.batch_size):
+                self._write(batch)
+                batch = []
+
+    def _write(self, batch):
+        delay = 0.5
+        attempt = 0
+        tries = 1 if self.outage else self.max_tries
+        while True:
+            attempt += 1
+            try:
+                self.collection.insert_many([doc for doc, _ in batch], ordered=True)
+                print(f'> [ChatWriter] {len(batch)}개 메시지 저장')
+                self.outage = False
+                break
+            except Exception as e:
+                print(f'> [ChatWriter] insert_many 실패({attempt}회): {e}')
+                if attempt >= tries or self.closing:
+                    self._spool(batch)
+                    self.outage = True
+                    break
+                time.sleep(delay)
+                delay = min(delay * 2, 8)
+
+        for _, on_saved in batch:
+            if on_saved is not None:
+                on_saved()
+        with self.cond:
+            self.pending -= len(batch)
+            self.cond.notify_all()
+
+    def _spool(self, batch):
+        """끝내 저장하지 못한 메시지를 파일로 남김 (다음 실행 때 수동으로 다시 넣을 수 있도록)"""
+        with open(self.spool_path, 'a', encoding='utf-8') as f:
+            for doc, _ in batch:
+                doc.pop('_id', None)
+                f.write(json.dumps(doc, ensure_ascii=False) + '\n')
+        print(f'> [ChatWriter] 저장하지 못한 {len(batch)}개 메시지를 {self.spool_path}에 기록')
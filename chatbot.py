@@ -1,15 +1,27 @@
 from typing import Optional
 from types import SimpleNamespace
+import os
 import time
 import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 from common import client, gpt_num_tokens, Model
 import json
-from function_tools import FUNCTION_DEFINITIONS, FUNCTION_MAP
-from memory_manager import MemoryManager
+from function_tools import FUNCTION_DEFINITIONS
+from tool_executor import execute_tool_calls
+from memory_manager import MemoryManager, classify_memory_need, MEMORY_WEAK_PATTERN
+from context_budget import ContextBudgeter
+from conversation import Conversation, ChatMessage
 from retry import retry
 import openai
 from openai import OpenAI
 
+# 기억 게이트(needs_memory)와 벡터 검색을 답변 준비와 겹쳐서 실행하기 위한 공용 풀
+memory_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='memory')
+
+# 답변 시작 전에 기억 게이트를 기다리는 상한(초) - 넘으면 기억 없이 바로 답변
+MEMORY_GATE_WAIT = float(os.getenv('MEMORY_GATE_WAIT', '1.5'))                # 과거를 가리키는 표현이 있을 때 (임베딩 → LLM)
+MEMORY_GATE_WAIT_NO_CUE = float(os.getenv('MEMORY_GATE_WAIT_NO_CUE', '0.3'))  # 표현이 없을 때 (로컬 임베딩 판단만)
+
 def dict_to_namespace(data):
     if isinstance(data, dict):
         return SimpleNamespace(**{k: dict_to_namespace(v) for k, v in data.items()})
@@ -27,20 +39,23 @@ def makeup_response(message: str, response_id: str = None):
     return dict_to_namespace(data)
 
 class Chatbot:
-    def __init__(self, model: Model, developer_role: str, instruction: str, max_rounds: int = 40, api_type: str = "responses", assistant_id: str = None, **kwargs):
+    def __init__(self, model: Model, developer_role: str, instruction: str, max_rounds: int = 40, api_type: str = "responses", assistant_id: str = None, run_background: bool = True, assistant_stream: bool = True, session_id: str = None, **kwargs):
         self.model = model
         self.developer_role = developer_role
         self.instruction = instruction
         self.max_rounds = max_rounds
         self.max_token_size = 16 * 1024
-        self.memoryManager = MemoryManager(**kwargs)
+        self.memoryManager = MemoryManager(session_id=session_id, **kwargs)
         self.user = kwargs['user']
         self.assistant = kwargs['assistant']
-        self.context = [{'role': 'developer', 'content': developer_role}]
-        self.context.extend(self.memoryManager.restore_chat())
+        # 오늘 대화를 복원한 append-only 버퍼 (복원된 메시지와 developer 메시지는 저장 완료로 취급)
+        self.session_id = session_id    # 세션 풀에서 만든 인스턴스는 자기 세션의 대화만 저장/복원
+        self.context = Conversation([ChatMessage('developer', developer_role)] + self.memoryManager.restore_chat(session_id=session_id))
+        self.budgeter = ContextBudgeter(model, self.max_token_size, self.max_rounds, user=self.user, assistant=self.assistant)
         
         # API 타입 설정
         self.api_type = api_type
+        self.assistant_stream = assistant_stream    # Assistant API 실행을 스트리밍 이벤트로 받을지 (False면 적응형 폴링)
         
         # Assistant API 사용 시 초기화
         if self.api_type == "assistant":
@@ -74,26 +89,20 @@ class Chatbot:
             self.thread = self.openai_client.beta.threads.create()
             self.runs = []
         
-        # 데몬 구동
-        bg_thread = threading.Thread(target=self.background_task)
-        bg_thread.daemon = True
-        bg_thread.start()
+        # 데몬 구동 (세션 풀에서 여러 인스턴스를 만들 때는 끄고 프로세스당 하나만 구동)
+        if run_background:
+            bg_thread = threading.Thread(target=self.background_task)
+            bg_thread.daemon = True
+            bg_thread.start()
 
     def background_task(self):
         while True:
             self.save_chat()
-            self.context = [ {'role': v['role'], 'content': v['content'], 'saved': True} for v in self.context ]
-            self.memoryManager.build_memory()
             time.sleep(3600)     # 1시간마다 반복
 
     def _as_api_messages(self):
-        api_msgs = []
-        for m in self.context:
-            role = m.get("role")
-            content = m.get("content")
-            if role in ("developer", "system", "user", "assistant") and isinstance(content, str):
-                api_msgs.append({"role": role, "content": content})
-        return api_msgs
+        """developer 메시지를 고정하고 토큰 예산(max_token_size)과 max_rounds 안으로 줄인 API 메시지"""
+        return self.budgeter.build(self.context.snapshot())
 
     @retry(tries=3, delay=2)
     def _add_user_message_to_thread(self, user_message):
@@ -111,9 +120,15 @@ class Chatbot:
             raise e 
 
     @retry(tries=3, delay=2)
-    def _create_assistant_run(self):
-        """Assistant API용 실행 생성"""
+    def _create_assistant_run(self, stream: bool = False):
+        """Assistant API용 실행 생성 (stream=True면 실행 이벤트 스트림을 반환)"""
         try:
+            if stream:
+                return self.openai_client.beta.threads.runs.create(
+                    thread_id=self.thread.id,
+                    assistant_id=self.openai_assistant.id,
+                    stream=True,
+                )
             run = self.openai_client.beta.threads.runs.create(
                 thread_id=self.thread.id,
                 assistant_id=self.openai_assistant.id,
@@ -126,31 +141,26 @@ class Chatbot:
                 self.openai_client.beta.threads.runs.cancel(thread_id=self.thread.id, run_id=self.runs[0])
             raise e
 
+    def _assistant_tool_outputs(self, run) -> list:
+        """Assistant API 실행이 요청한 함수들을 동시에 실행하고 호출 순서대로 tool_outputs 목록을 반환"""
+        tool_calls = run.required_action.submit_tool_outputs.tool_calls
+        calls = [(tool_call.function.name, self._parse_arguments(tool_call.function.arguments)) for tool_call in tool_calls]
+        results = execute_tool_calls(calls)
+        
+        return [
+            {"tool_call_id": tool_call.id, "output": json.dumps(result, ensure_ascii=False)}
+            for tool_call, result in zip(tool_calls, results)
+        ]
+
+    def _parse_arguments(self, arguments) -> dict:
+        if isinstance(arguments, str):
+            return json.loads(arguments) if arguments else {}
+        return arguments or {}
+
     def _handle_function_calls(self, run):
         """Assistant API에서 function calling 처리"""
         try:
-            required_actions = run.required_action.submit_tool_outputs.tool_calls
-            tool_outputs = []
-            
-            for tool_call in required_actions:
-                func_name = tool_call.function.name
-                arguments = json.loads(tool_call.function.arguments)
-                
-                print(f"Executing function: {func_name} with arguments: {arguments}")
-                
-                try:
-                    # 함수 실행
-                    if func_name in FUNCTION_MAP:
-                        result = FUNCTION_MAP[func_name](**arguments)
-                    else:
-                        result = {"error": "Function not found"}
-                except Exception as e:
-                    result = {"error": str(e)}
-                
-                tool_outputs.append({
-                    "tool_call_id": tool_call.id,
-                    "output": json.dumps(result, ensure_ascii=False)
-                })
+            tool_outputs = self._assistant_tool_outputs(run)
             
             # Tool outputs 제출
             self.openai_client.beta.threads.runs.submit_tool_outputs(
@@ -162,12 +172,46 @@ class Chatbot:
         except Exception as e:
             print(f"Function calling error: {e}")
             # 에러가 발생해도 run을 취소하거나 처리를 중단하지 않음
+
+    def _stream_assistant_run(self):
+        """Assistant API 실행을 스트리밍 이벤트로 진행 - ('delta', 텍스트)를 흘려보내고 마지막에 ('completed', 답변)"""
+        stream = self._create_assistant_run(stream=True)
+        reply = ""
+        while stream is not None:
+            next_stream = None
+            for event in stream:
+                if event.event == 'thread.run.created':
+                    self.runs.append(event.data.id)
+                elif event.event == 'thread.message.delta':
+                    for part in event.data.delta.content or []:
+                        if part.type == 'text' and part.text and part.text.value:
+                            yield 'delta', part.text.value
+                elif event.event == 'thread.message.completed':
+                    # 완성된 메시지 본문을 최종 답변으로 사용 (여러 개면 마지막 메시지)
+                    reply = "".join(part.text.value for part in event.data.content if part.type == 'text')
+                elif event.event == 'thread.run.requires_action':
+                    # Function calling 처리 후 결과 제출도 스트림으로 이어서 받음
+                    print("Function calling required...")
+                    next_stream = self.openai_client.beta.threads.runs.submit_tool_outputs(
+                        thread_id=self.thread.id,
+                        run_id=event.data.id,
+                        tool_outputs=self._assistant_tool_outputs(event.data),
+                        stream=True,
+                    )
+                elif event.event in ('thread.run.failed', 'thread.run.cancelled', 'thread.run.expired'):
+                    # 실패, 취소, 만료 등 오류 상태 처리
+                    last_error = event.data.last_error
+                    yield 'completed', f'{last_error.code}: {last_error.message}' if last_error else event.event
+                    return
+            stream = next_stream
+        yield 'completed', reply
     
     def _get_assistant_response_content(self, run):
-        """Assistant API용 응답 내용 가져오기"""
+        """Assistant API용 응답 내용 가져오기 (스트리밍을 쓰지 않을 때 - 50ms부터 늘려가는 적응형 폴링)"""
         max_polling_time = 60    # 최대 1분 동안 폴링
         start_time = time.time()
         retrieved_run = run
+        interval = 0.05
 
         while True:
             elapsed_time = time.time() - start_time
@@ -186,55 +230,119 @@ class Chatbot:
                 # Function calling 처리
                 print("Function calling required...")
                 self._handle_function_calls(retrieved_run)
+                interval = 0.05    # 함수 결과 제출 직후에는 다시 짧게 확인
+                continue
             elif retrieved_run.status in ['failed', 'cancelled', 'expired']:
                 # 실패, 취소, 만료 등 오류 상태 처리
                 code = retrieved_run.last_error.code
                 message = retrieved_run.last_error.message
                 return retrieved_run, f'{code}: {message}'
             
-            time.sleep(1) 
+            time.sleep(interval)
+            interval = min(interval * 2, 1.0)
             
-        # Run이 완료된 후 메시지를 가져옴
-        messages = self.openai_client.beta.threads.messages.list(thread_id=self.thread.id)
-        resp_message = [m.content[0].text for m in messages if m.run_id == run.id][0]
+        # Run이 완료된 후 이 run이 만든 최신 메시지만 가져옴
+        messages = self.openai_client.beta.threads.messages.list(
+            thread_id=self.thread.id,
+            run_id=run.id,
+            order='desc',
+            limit=1
+        )
+        resp_message = [m.content[0].text for m in messages.data][0]
         return retrieved_run, resp_message.value
 
     def _chat_with_assistant(self, message: str) -> SimpleNamespace:
         """Assistant API를 사용한 채팅"""
+        response_content = None
+        for event in self._chat_with_assistant_stream(message):
+            if event["type"] == "done":
+                response_content = event["reply"]
+            elif event["type"] == "error":
+                return makeup_response(event["error"])
+
+        # SimpleNamespace 형태로 반환
+        data = {
+            "output": [{"content": [{"text": response_content}], "role": "assistant"}],
+            "output_text": response_content,
+            "usage": {"total_tokens": 0}
+        }
+        return dict_to_namespace(data)
+
+    def _chat_with_assistant_stream(self, message: str):
+        """Assistant API를 사용한 채팅 - 델타가 도착하는 대로 이벤트 dict를 yield"""
         try:
             print(f"Assistant API: Chat called with message: {message}")
             
             # 사용자 메시지를 스레드에 추가
             self._add_user_message_to_thread(message)
             
-            # 실행 생성
-            run = self._create_assistant_run()
-            
-            # 응답 가져오기
-            _, response_content = self._get_assistant_response_content(run)
+            # 실행 생성 후 응답 가져오기
+            if self.assistant_stream:
+                response_content = ""
+                for kind, payload in self._stream_assistant_run():
+                    if kind == "delta":
+                        yield {"type": "delta", "text": payload}
+                    else:
+                        response_content = payload
+            else:
+                run = self._create_assistant_run()
+                _, response_content = self._get_assistant_response_content(run)
+                yield {"type": "delta", "text": response_content}
             
             # 컨텍스트에 메시지 추가
-            self.context.append({"role": "user", "content": message, "saved": False})
-            self.context.append({"role": "assistant", "content": response_content, "saved": False})
+            self._append_message("user", message)
+            self._append_message("assistant", response_content)
             
-            # SimpleNamespace 형태로 반환
-            data = {
-                "output": [{"content": [{"text": response_content}], "role": "assistant"}],
-                "output_text": response_content,
-                "usage": {"total_tokens": 0}
-            }
-            return dict_to_namespace(data)
+            yield {"type": "done", "reply": response_content, "response_id": None}
             
         except Exception as e:
             error_msg = f"[Assistant API 오류] 잠시 후 다시 시도해주세요. 상세: {type(e).__name__}: {e}"
             print(f"Assistant API Chat error: {error_msg}")
-            return makeup_response(error_msg)
+            yield {"type": "error", "error": error_msg}
+
+    def _execute_function_calls(self, output_items) -> list:
+        """Responses API 출력의 function_call 항목들을 동시에 실행하고 호출 순서대로 function_call_output 목록을 반환"""
+        function_calls = []
+        for item in output_items or []:
+            print(f"Processing output item: {item.name if hasattr(item, 'name') else item}")
+            # Responses API에서는 function call이 별도 item(type='function_call')로 옴
+            if getattr(item, "type", None) == "function_call":
+                function_calls.append(item)
+        if not function_calls:
+            return []
+
+        results = execute_tool_calls([(item.name, self._parse_arguments(item.arguments)) for item in function_calls])
+        return [
+            {
+                "type": "function_call_output",
+                "call_id": item.call_id,             # ← 반드시 첫 호출의 call_id 그대로
+                "output": json.dumps(result, ensure_ascii=False)
+            }
+            for item, result in zip(function_calls, results)
+        ]
+
+    def _append_assistant_reply(self, response) -> str:
+        """응답 객체에서 assistant 메시지를 꺼내 컨텍스트에 추가하고 마지막 답변을 반환"""
+        reply = ""
+        if hasattr(response, 'output') and response.output:
+            for output in response.output:
+                if hasattr(output, 'role') and output.role == 'assistant':
+                    content = ""
+                    if hasattr(output, 'content') and output.content:
+                        if isinstance(output.content, list) and len(output.content) > 0:
+                            content = output.content[0].text if hasattr(output.content[0], 'text') else str(output.content[0])
+                        else:
+                            content = str(output.content)
+                    self._append_message("assistant", content)
+                    reply = content
+        return reply
+
     def _chat(self, message: str, previous_response_id: Optional[str] = None) -> SimpleNamespace:
         """메시지를 처리하고 응답 생성 - OpenAI Function Calling 지원 (Responses API)"""
         try:
             print(f"Responses API: Chat called with message: {message}, previous_response_id: {previous_response_id}")
             
-            self.context.append({"role": "user", "content": message, "saved": False})
+            self._append_message("user", message)
             input_data = self._as_api_messages()
             
             # 첫 번째 API 호출 - Function calling 가능성 확인
@@ -247,24 +355,7 @@ class Chatbot:
             
             print("First API response received")
 
-            tool_outputs = []
-            if hasattr(first, "output") and first.output:
-                for item in first.output:
-                    print(f"Processing output item: {item.name if hasattr(item, 'name') else item}")
-                # Responses API에서는 function call이 별도 item(type='function_call')로 옴
-                    if getattr(item, "type", None) == "function_call":
-                        fn_name = item.name
-                        args = json.loads(item.arguments) if isinstance(item.arguments, str) else (item.arguments or {})
-                        try:
-                            result = FUNCTION_MAP[fn_name](**args) if fn_name in FUNCTION_MAP else {"error": "Function not found"}
-                        except Exception as e:
-                            result = {"error": str(e)}
-
-                        tool_outputs.append({
-                            "type": "function_call_output",
-                            "call_id": item.call_id,             # ← 반드시 첫 호출의 call_id 그대로
-                            "output": json.dumps(result, ensure_ascii=False)
-                        })
+            tool_outputs = self._execute_function_calls(getattr(first, "output", None))
 
             # Function call이 있었다면 최종 응답 생성
             if tool_outputs:
@@ -280,16 +371,7 @@ class Chatbot:
                 print("No function calls, using original response")
                 result_response = first
             
-            if hasattr(result_response, 'output') and result_response.output:
-                for output in result_response.output:
-                    if hasattr(output, 'role') and output.role == 'assistant':
-                        content = ""
-                        if hasattr(output, 'content') and output.content:
-                            if isinstance(output.content, list) and len(output.content) > 0:
-                                content = output.content[0].text if hasattr(output.content[0], 'text') else str(output.content[0])
-                            else:
-                                content = str(output.content)
-                        self.context.append({"role": "assistant", "content": content, "saved": False})
+            self._append_assistant_reply(result_response)
             
             return result_response
             
@@ -297,27 +379,141 @@ class Chatbot:
             error_msg = f"[Responses API 오류] 잠시 후 다시 시도해주세요. 상세: {type(e).__name__}: {e}"
             print(f"Responses API Chat error: {error_msg}")
             return makeup_response(error_msg)
+
+    def _stream_response(self, **kwargs):
+        """Responses API 스트리밍 호출 - ('delta', 텍스트) 이벤트를 흘려보내고 마지막에 ('completed', response)를 보냄"""
+        for event in client.responses.create(stream=True, **kwargs):
+            event_type = getattr(event, "type", None)
+            if event_type == "response.output_text.delta":
+                yield "delta", event.delta
+            elif event_type == "response.completed":
+                yield "completed", event.response
+            elif event_type in ("response.failed", "error"):
+                error = getattr(getattr(event, "response", None), "error", None) or getattr(event, "message", None)
+                raise RuntimeError(f"stream {event_type}: {error}")
+
+    def _chat_stream(self, message: str, previous_response_id: Optional[str] = None):
+        """Responses API 스트리밍 버전의 _chat - 델타가 도착하는 대로 이벤트 dict를 yield"""
+        try:
+            print(f"Responses API: Stream chat called with message: {message}, previous_response_id: {previous_response_id}")
+
+            self._append_message("user", message)
+            input_data = self._as_api_messages()
+
+            # 첫 번째 호출 - 바로 답하는 경우 델타가 곧바로 브라우저로 전달됨
+            first = None
+            for kind, payload in self._stream_response(
+                model=self.model.basic,
+                input=input_data,
+                tools=FUNCTION_DEFINITIONS,
+                tool_choice="auto"
+            ):
+                if kind == "delta":
+                    yield {"type": "delta", "text": payload}
+                else:
+                    first = payload
+
+            result_response = first
+            tool_outputs = self._execute_function_calls(getattr(first, "output", None))
+            if tool_outputs:
+                print("Streaming final response after function execution")
+                for kind, payload in self._stream_response(
+                    model=self.model.advanced,
+                    instructions=self.instruction,
+                    input=tool_outputs,
+                    previous_response_id=first.id
+                ):
+                    if kind == "delta":
+                        yield {"type": "delta", "text": payload}
+                    else:
+                        result_response = payload
+
+            reply = self._append_assistant_reply(result_response)
+            yield {"type": "done", "reply": reply, "response_id": getattr(result_response, "id", None)}
+
+        except Exception as e:
+            error_msg = f"[Responses API 오류] 잠시 후 다시 시도해주세요. 상세: {type(e).__name__}: {e}"
+            print(f"Responses API Stream chat error: {error_msg}")
+            yield {"type": "error", "error": error_msg}
     
     def chat(self, message: str, previous_response_id: Optional[str] = None) -> SimpleNamespace:
         print(f'> [chat 메서드] 입력된 message: {message}')
         print(f'> [chat 메서드] API 타입: {self.api_type}')
         
-        memory_instruction = self.retrieve_memory(message)
-        if memory_instruction is not None:
-            message += memory_instruction
+        message = self._prepare_message(message)
         
         # API 타입에 따라 다른 메서드 호출
         if self.api_type == "assistant":
             return self._chat_with_assistant(message)
         else:  # "responses" (기본값)
             return self._chat(message, previous_response_id)
+
+    def chat_stream(self, message: str, previous_response_id: Optional[str] = None):
+        """chat()의 스트리밍 버전 - {'type': 'delta'|'done'|'error', ...} 이벤트를 순서대로 yield"""
+        print(f'> [chat_stream 메서드] 입력된 message: {message}')
+
+        message = self._prepare_message(message)
+
+        if self.api_type == "assistant":
+            yield from self._chat_with_assistant_stream(message)
+        else:
+            yield from self._chat_stream(message, previous_response_id)
+
+    def _prepare_message(self, message: str) -> str:
+        """기억 조회를 시작해 두고, 기다리는 동안 컨텍스트 예산 정리를 먼저 수행한 뒤 결과를 반영"""
+        lookup = self._start_memory_lookup(message)
+        if self.api_type != "assistant":
+            self._as_api_messages()    # 필요하면 오래된 대화를 요약으로 접어 둠 (다음 호출은 새 메시지만 반영)
+
+        memory_instruction = self._finish_memory_lookup(message, lookup)
+        if memory_instruction is not None:
+            message += memory_instruction
+        return message
     
     def retrieve_memory(self, user_message):
         print(f'> [retrieve_memory] 실제 검색할 메시지: {user_message}')
-        if not self.memoryManager.needs_memory(user_message):
+        return self._finish_memory_lookup(user_message, self._start_memory_lookup(user_message))
+
+    def _start_memory_lookup(self, user_message):
+        """기억 게이트와 벡터 검색을 동시에 시작 - (게이트 future 또는 None, 후보 future 또는 None, 게이트 대기 마감 시각)
+
+        - 확실한 기억 질의: 게이트 없이 검색
+        - 과거를 가리키는 표현이 있음: 게이트(임베딩 → LLM)와 검색을 함께 시작하고 MEMORY_GATE_WAIT까지만 기다림
+        - 표현이 없음: 로컬 임베딩 게이트만 MEMORY_GATE_WAIT_NO_CUE까지 기다림 (LLM 판단은 하지 않음)
+        """
+        verdict = classify_memory_need(user_message)
+        cue = verdict is True or bool(MEMORY_WEAK_PATTERN.search(user_message))
+
+        # 과거를 가리키는 표현이 있으면 게이트 결과를 기다리지 않고 벡터 검색을 먼저 시작 (게이트가 FALSE면 결과는 버림)
+        candidates = memory_executor.submit(self.memoryManager.search_vector_db, user_message) if cue else None
+        if verdict is True:
+            return None, candidates, None
+        if cue:
+            gate = memory_executor.submit(self.memoryManager.needs_memory, user_message)
+            return gate, candidates, time.time() + MEMORY_GATE_WAIT
+        gate = memory_executor.submit(self.memoryManager.needs_memory, user_message, allow_llm=False)
+        return gate, None, time.time() + MEMORY_GATE_WAIT_NO_CUE
+
+    def _finish_memory_lookup(self, user_message, lookup):
+        gate, candidates, deadline = lookup
+        if gate is not None:
+            try:
+                needed = gate.result(timeout=max(0, deadline - time.time()))
+            except TimeoutError:
+                # 답변이 기억 판단을 기다리지 않도록 제한 시간이 지나면 기억 없이 진행
+                print('> [memory] 기억 게이트가 제한 시간 안에 끝나지 않아 기억 없이 답변')
+                needed = False
+            if not needed:
+                if candidates is not None:
+                    candidates.cancel()
+                return None
+
+        try:
+            memory = self.memoryManager.retrieve_memory(user_message, candidates=candidates.result() if candidates is not None else None)
+        except Exception as e:
+            print(f'> [retrieve_memory] error: {e}')
             return None
 
-        memory = self.memoryManager.retrieve_memory(user_message)  
         if memory is not None:
             whisper = (f'[귓속말]\n{self.assistant} 기억 속 대화 내용이야. 앞으로 이 내용을 참조하면서 답해줘. '
                        f'알마 전에 나누었던 대화라는 점을 자연스럽게 말해줘:\n{memory}')
@@ -326,12 +522,20 @@ class Chatbot:
         else:
             return '[기억이 안난다고 답할 것!]'
         
+    def _append_message(self, role: str, content: str):
+        """컨텍스트에 메시지를 추가하고 저장 대기열에 넣음 (Mongo 저장은 백그라운드 writer가 묶어서 처리)"""
+        self.context.append(role, content, persist=self._persist_message)
+
+    def _persist_message(self, message: ChatMessage, index: int):
+        self.memoryManager.enqueue_chat(message, session_id=self.session_id, on_saved=lambda: self.context.mark_persisted(index))
+
     def add_user_message(self, message: str):
-        self.context.append({'role': 'user', 'content': message, 'saved': False})
+        self._append_message('user', message)
 
     def save_chat(self):
-        """대화 내용을 저장"""
-        self.context =self.memoryManager.save_chat(self.context)
+        """대기 중인 대화 내용을 모두 저장될 때까지 기다림 (저장할 메시지가 없으면 바로 반환)"""
+        if self.context.unsaved_count() > 0:
+            self.memoryManager.save_chat()
 
 
 
@@ -1,5 +1,9 @@
 from dataclasses import dataclass
+from collections import OrderedDict, deque
+import functools
+import hashlib
 import os
+import threading
 import pytz
 from datetime import datetime, timedelta
 from openai import OpenAI
@@ -35,13 +39,75 @@ def currTime():
     formatted_now = now.strftime('%Y.%m.%d %H:%M:%S')   # 시각을 원하는 형식의 문자열로 변환합니다.
     return(formatted_now)
 
+TOKENS_PER_MESSAGE = 3    # 모든 메시지는 다음 형식을 따른다: <|start|>{role/name}\n{content}<|end|>\n
+TOKENS_PER_REPLY = 3      # 모든 메시지는 다음 형식으로 assistant의 답변을 준비한다: <|start|>assistant<|message|>
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model='gpt-4o'):
+    """tiktoken 인코딩은 로딩 비용이 크므로 모델별로 한 번만 불러온다"""
+    return tiktoken.encoding_for_model(model)
+
+class TokenCounter:
+    """메시지별 토큰 수를 내용 해시로 캐시하고, 컨텍스트 구간의 누적 합계를 유지한다
+
+    - count(): 캐시된 메시지는 인코딩 없이 바로 반환
+    - append()/popleft(): 구간 끝에 추가하거나 앞에서 잘라낼 때 합계를 O(1)로 갱신
+    문자열이 아닌 값('saved' 플래그 등)은 토큰 계산에서 제외한다.
+    """
+
+    def __init__(self, model='gpt-4o', max_cache_size=10000):
+        self.encoding = get_encoding(model)
+        self.max_cache_size = max_cache_size
+        self.cache = OrderedDict()    # 내용 해시 -> 토큰 수 (LRU)
+        self.counts = deque()         # 현재 구간의 메시지별 토큰 수
+        self.total = 0
+        self.lock = threading.Lock()
+
+    def count(self, message) -> int:
+        values = [value for value in message.values() if isinstance(value, str)]
+        key = hashlib.blake2b('\0'.join(values).encode('utf-8'), digest_size=16).digest()
+        with self.lock:
+            tokens = self.cache.get(key)
+            if tokens is not None:
+                self.cache.move_to_end(key)
+                return tokens
+
+        tokens = TOKENS_PER_MESSAGE + sum(len(self.encoding.encode(value)) for value in values)
+        with self.lock:
+            self.cache[key] = tokens
+            if len(self.cache) > self.max_cache_size:
+                self.cache.popitem(last=False)
+        return tokens
+
+    def append(self, message) -> int:
+        tokens = self.count(message)
+        self.counts.append(tokens)
+        self.total += tokens
+        return tokens
+
+    def popleft(self) -> int:
+        tokens = self.counts.popleft()
+        self.total -= tokens
+        return tokens
+
+    def clear(self):
+        self.counts.clear()
+        self.total = 0
+
+    @property
+    def num_tokens(self) -> int:
+        """구간 전체를 API에 보낼 때의 토큰 수 (답변 준비 토큰 포함)"""
+        return self.total + TOKENS_PER_REPLY
+
+    def __len__(self):
+        return len(self.counts)
+
+_token_counters = {}
+
 def gpt_num_tokens(messages, model='gpt-4o'):
-    encoding = tiktoken.encoding_for_model(model)
-    tokens_per_message = 3    # 모든 메시지는 다음 형식을 따른다: <|start|>{role/name}\n{content}<|end|>\n
-    num_tokens = 0
-    for message in messages:
-        num_tokens += tokens_per_message
-        for _, value in message.items():
-            num_tokens += len(encoding.encode(value))
-    num_tokens += 3    # 모든 메시지는 다음 형식으로 assistant의 답변을 준비한다: <|start|>assistant<|message|>
+    counter = _token_counters.get(model)
+    if counter is None:
+        counter = _token_counters.setdefault(model, TokenCounter(model))
+    num_tokens = sum(counter.count(message) for message in messages)
+    num_tokens += TOKENS_PER_REPLY
     return num_tokens
@@ -0,0 +1,145 @@
+from collections import deque
+from common import client, gpt_num_tokens, Model, TokenCounter
+
+ROLLING_SUMMARY_TEMPLATE = """
+당신은 대화 내용을 누적 요약하는 기계입니다.
+1. [이전 요약]과 [대화]를 합쳐 하나의 요약으로 작성합니다.
+2. 요약 내용에는 '브라이언은...', '테오는...'처럼 대화자의 이름이 들어가야 합니다.
+3. 이후 대화에 필요한 사실, 결정 사항, 진행 중인 작업은 빠뜨리지 않습니다.
+4. 요약 외의 부가 정보는 포함하지 않습니다.
+"""
+
+API_ROLES = ("developer", "system", "user", "assistant")
+
+
+class ContextBudgeter:
+    """Chatbot.context를 토큰 예산과 최대 라운드 수 안으로 맞춰 API 메시지로 만든다
+
+    - 맨 앞의 developer 메시지는 항상 고정
+    - 예산을 넘는 오래된 대화는 누적 요약(running summary)으로 접어 developer 메시지로 전달
+    - 한 번 잘라낼 때 예산의 trim_ratio 까지 줄여서 요약 호출이 매 턴 일어나지 않도록 함
+    - 요약되지 않은 구간의 토큰 수는 TokenCounter로 누적 관리하므로 매 턴 새 메시지만 인코딩
+    - 접을 대화는 fold_chunk_tokens 크기 묶음으로 나눠 요약하고, 요약에 성공한 묶음까지만 접힌 것으로 기록
+    """
+
+    def __init__(self, model: Model, max_token_size: int, max_rounds: int, user: str, assistant: str, trim_ratio: float = 0.75, fold_chunk_tokens: int = None):
+        self.model = model
+        self.max_token_size = max_token_size
+        self.max_rounds = max_rounds
+        self.user = user
+        self.assistant = assistant
+        self.trim_ratio = trim_ratio
+        self.fold_chunk_tokens = fold_chunk_tokens or max_token_size // 2    # 요약 호출 하나에 넣을 대화 토큰 수
+        self.summary = ""
+        self.folded_upto = 1    # context[1:folded_upto]는 이미 요약에 접힌 구간
+        self.counted_upto = 1   # context[folded_upto:counted_upto]가 window/counter에 반영됨
+        self.window = deque()   # (context 인덱스, API 메시지)
+        self.rounds = 0         # window 안의 user 메시지 수
+        self.counter = TokenCounter()
+
+    def build(self, context: list) -> list:
+        pinned = [self._as_api_message(context[0])]
+        self._extend(context)
+
+        if self.rounds <= self.max_rounds and self.counter.num_tokens + self._summary_reserve() <= self.max_token_size:
+            return pinned + self._summary_messages() + [m for _, m in self.window]
+
+        # 예산의 trim_ratio 까지 줄어들도록 최근 메시지부터 채움 (현재 메시지 하나는 반드시 남김)
+        history = list(self.window)
+        budget = int(self.max_token_size * self.trim_ratio) - gpt_num_tokens(pinned) - self._summary_reserve()
+        max_rounds = max(1, int(self.max_rounds * self.trim_ratio))
+        keep_from = len(history) - 1
+        used = self.counter.count(history[-1][1])
+        rounds = self._rounds([history[-1][1]])
+        for pos in range(len(history) - 2, -1, -1):
+            message = history[pos][1]
+            tokens = self.counter.count(message)
+            rounds += self._rounds([message])
+            if used + tokens > budget or rounds > max_rounds:
+                break
+            used += tokens
+            keep_from = pos
+        # 남기는 구간은 user 메시지로 시작하도록 맞춤 (짝을 잃은 assistant 답변은 요약으로)
+        while keep_from < len(history) - 1 and history[keep_from][1]['role'] != 'user':
+            keep_from += 1
+
+        cut = history[keep_from][0]
+        self.folded_upto += self._fold(context[self.folded_upto:cut])
+        while self.window and self.window[0][0] < self.folded_upto:
+            _, message = self.window.popleft()
+            self.counter.popleft()
+            self.rounds -= self._rounds([message])
+        if self.folded_upto < cut:
+            print(f'> [ContextBudgeter] 요약 실패로 context[{self.folded_upto}:{cut}]는 접지 않고 남김 (다음 턴에 재시도)')
+        print(f'> [ContextBudgeter] context[{self.folded_upto}] 이전 메시지를 요약으로 접음, 남은 메시지 {len(self.window)}개')
+        return pinned + self._summary_messages() + [m for _, m in self.window]
+
+    def _extend(self, context):
+        """지난 호출 이후 새로 추가된 메시지만 window와 토큰 합계에 반영"""
+        for i in range(self.counted_upto, len(context)):
+            message = self._as_api_message(context[i])
+            if message is None:
+                continue
+            self.window.append((i, message))
+            self.counter.append(message)
+            self.rounds += self._rounds([message])
+        self.counted_upto = len(context)
+
+    def _rounds(self, messages):
+        return sum(1 for m in messages if m['role'] == 'user')
+
+    def _summary_messages(self):
+        if not self.summary:
+            return []
+        return [{'role': 'developer', 'content': f'[이전 대화 요약]\n{self.summary}'}]
+
+    def _summary_reserve(self):
+        return gpt_num_tokens(self._summary_messages()) if self.summary else 0
+
+    def _fold(self, messages):
+        """잘려나가는 메시지를 fold_chunk_tokens 크기 묶음씩 기존 요약과 합쳐 새 요약으로 만듦
+
+        요약에 성공한 앞쪽 메시지 수를 반환 - 실패한 묶음부터는 접지 않으므로 대화가 조용히 사라지지 않음
+        """
+        folded = 0
+        lines, count, used = [], 0, 0    # 현재 묶음의 대화 줄, 묶음에 속한 context 메시지 수, 토큰 수
+        for message in messages:
+            m = self._as_api_message(message)
+            if m is not None and m['role'] in ('user', 'assistant'):
+                tokens = gpt_num_tokens([m])
+                if lines and used + tokens > self.fold_chunk_tokens:
+                    if not self._summarize(lines):
+                        return folded
+                    folded += count
+                    lines, count, used = [], 0, 0
+                speaker = self.user if m['role'] == 'user' else self.assistant
+                lines.append(f"{speaker}: {m['content']}")
+                used += tokens
+            count += 1
+        if lines and not self._summarize(lines):
+            return folded
+        return folded + count
+
+    def _summarize(self, lines):
+        """대화 줄을 기존 요약과 합쳐 self.summary를 갱신 - 실패하면 False (기존 요약 유지)"""
+        try:
+            response = client.responses.create(
+                model=self.model.basic,
+                input=[
+                    {'role': 'developer', 'content': ROLLING_SUMMARY_TEMPLATE},
+                    {'role': 'user', 'content': f'[이전 요약]\n{self.summary}\n\n[대화]\n' + '\n'.join(lines)},
+                ],
+            )
+            self.summary = response.output_text.strip()
+            print('> [ContextBudgeter] 누적 요약:', self.summary)
+            return True
+        except Exception as e:
+            print(f'> [ContextBudgeter] summarize error: {e}')
+            return False
+
+    def _as_api_message(self, message):
+        role = message.get("role")
+        content = message.get("content")
+        if role in API_ROLES and isinstance(content, str):
+            return {"role": role, "content": content}
+        return None
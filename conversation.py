@@ -0,0 +1,94 @@
+import threading
+
+
+class ChatMessage:
+    """대화 메시지 한 개 - dict 대신 __slots__로 메모리를 줄이고, 기존 코드가 쓰던 get()/[] 접근은 그대로 지원"""
+
+    __slots__ = ('role', 'content')
+
+    def __init__(self, role: str, content: str):
+        self.role = role
+        self.content = content
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __repr__(self):
+        return f'ChatMessage({self.role!r}, {self.content!r})'
+
+
+class ConversationSnapshot:
+    """특정 시점까지의 대화를 복사 없이 읽는 뷰 (append-only이므로 길이만 고정하면 됨)"""
+
+    __slots__ = ('_messages', '_length')
+
+    def __init__(self, messages: list, length: int):
+        self._messages = messages
+        self._length = length
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._messages[slice(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError(index)
+        return self._messages[index]
+
+    def __iter__(self):
+        for i in range(self._length):
+            yield self._messages[i]
+
+
+class Conversation:
+    """append-only 대화 버퍼
+
+    - 메시지는 뒤에만 추가되고 수정/재생성되지 않음
+    - persisted 워터마크 이전의 메시지는 DB에 저장 완료된 것 (저장 여부 확인이 O(1))
+    - append/snapshot은 여러 스레드(요청, 저장 writer)에서 동시에 호출해도 안전
+    """
+
+    def __init__(self, messages=(), persisted: int = None):
+        self._messages = list(messages)
+        self._persisted = len(self._messages) if persisted is None else persisted
+        self._lock = threading.Lock()
+
+    def append(self, role: str, content: str, persist=None) -> int:
+        """메시지를 추가하고 그 인덱스를 반환 - persist(message, index)는 추가 순서대로 저장 대기열에 넣도록 lock 안에서 호출"""
+        with self._lock:
+            message = ChatMessage(role, content)
+            self._messages.append(message)
+            index = len(self._messages) - 1
+            if persist is not None:
+                persist(message, index)
+            return index
+
+    def mark_persisted(self, index: int):
+        """index 번째 메시지까지 저장되었음을 기록 (writer는 순서대로 저장하므로 워터마크만 전진)"""
+        with self._lock:
+            self._persisted = max(self._persisted, index + 1)
+
+    @property
+    def persisted(self) -> int:
+        return self._persisted
+
+    def unsaved_count(self) -> int:
+        return len(self._messages) - self._persisted
+
+    def snapshot(self) -> ConversationSnapshot:
+        with self._lock:
+            return ConversationSnapshot(self._messages, len(self._messages))
+
+    def __len__(self):
+        return len(self._messages)
+
+    def __getitem__(self, index):
+        return self._messages[index]
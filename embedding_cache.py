@@ -0,0 +1,132 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+
+class EmbeddingCache:
+    """텍스트 내용 해시를 키로 임베딩 벡터를 캐시한다
+
+    - 1단계: 프로세스 내 LRU (max_entries 개, float32 array로 보관해 ada-002 벡터 하나에 약 6KiB)
+    - 2단계(선택): db_path를 주면 SQLite 파일에 float32로 저장, 전체 크기가 max_db_bytes를 넘으면
+      가장 오래 사용되지 않은 항목부터 삭제
+    같은 질문이나 이미 넣었던 요약은 임베딩 API를 다시 호출하지 않는다.
+    """
+
+    def __init__(self, client, model: str, max_entries: int = 2048, db_path: str = None, max_db_bytes: int = 256 * 1024 * 1024):
+        self.client = client
+        self.model = model
+        self.max_entries = max_entries
+        self.max_db_bytes = max_db_bytes
+        self.memory = OrderedDict()    # key -> array('f') 벡터 (반환할 때만 list로 변환)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self.db = None
+        if db_path:
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS embeddings '
+                '(key BLOB PRIMARY KEY, vector BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)'
+            )
+            self.db.execute('CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)')
+            self.db.commit()
+            self.db_bytes = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM embeddings').fetchone()[0]
+
+    def key(self, text: str) -> bytes:
+        return hashlib.sha256(f'{self.model}\0{text}'.encode('utf-8')).digest()
+
+    def embed(self, text: str) -> list:
+        key = self.key(text)
+        vector = self.get(key)
+        if vector is not None:
+            return vector
+
+        vector = self.client.embeddings.create(input=text, model=self.model).data[0].embedding
+        self.put(key, vector)
+        return vector
+
+    def embed_many(self, texts: list) -> list:
+        """여러 텍스트를 임베딩 - 캐시에 없는 것만 모아서 한 번의 다중 입력 요청으로 보냄"""
+        keys = [self.key(text) for text in texts]
+        vectors = [self.get(key) for key in keys]
+
+        missing = {}    # key -> 텍스트 (같은 텍스트는 한 번만 요청)
+        for key, text, vector in zip(keys, texts, vectors):
+            if vector is None:
+                missing.setdefault(key, text)
+        if missing:
+            response = self.client.embeddings.create(input=list(missing.values()), model=self.model)
+            embedded = {}
+            for key, data in zip(missing, sorted(response.data, key=lambda d: d.index)):
+                embedded[key] = data.embedding
+                self.put(key, data.embedding)
+            vectors = [vector if vector is not None else embedded[key] for key, vector in zip(keys, vectors)]
+        return vectors
+
+    def get(self, key: bytes):
+        with self.lock:
+            vector = self.memory.get(key)
+            if vector is not None:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return vector.tolist()
+
+            if self.db is not None:
+                row = self.db.execute('SELECT vector FROM embeddings WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    self.db.execute('UPDATE embeddings SET last_used = ? WHERE key = ?', (time.time(), key))
+                    self.db.commit()
+                    vector = array('f', row[0])
+                    self._remember(key, vector)
+                    self.hits += 1
+                    return vector.tolist()
+
+            self.misses += 1
+            return None
+
+    def put(self, key: bytes, vector: list):
+        vector = array('f', vector)
+        with self.lock:
+            self._remember(key, vector)
+            if self.db is None:
+                return
+
+            blob = vector.tobytes()
+            previous = self.db.execute('SELECT size FROM embeddings WHERE key = ?', (key,)).fetchone()
+            self.db.execute(
+                'INSERT OR REPLACE INTO embeddings (key, vector, size, last_used) VALUES (?, ?, ?, ?)',
+                (key, blob, len(blob), time.time())
+            )
+            self.db_bytes += len(blob) - (previous[0] if previous else 0)
+            self._evict_db()
+            self.db.commit()
+
+    def _remember(self, key, vector):
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def _evict_db(self):
+        """SQLite 저장소가 max_db_bytes를 넘으면 오래 사용되지 않은 항목부터 삭제"""
+        while self.db_bytes > self.max_db_bytes:
+            rows = self.db.execute('SELECT key, size FROM embeddings ORDER BY last_used LIMIT 64').fetchall()
+            if not rows:
+                self.db_bytes = 0
+                break
+            evicted = []
+            for key, size in rows:
+                if self.db_bytes <= self.max_db_bytes:
+                    break
+                evicted.append((key,))
+                self.db_bytes -= size
+            self.db.executemany('DELETE FROM embeddings WHERE key = ?', evicted)
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
@@ -4,157 +4,383 @@ OpenAI Function Calling을 위한 도구들과 함수 정의
 
 import requests
 from bs4 import BeautifulSoup
+import http_client
 from datetime import datetime
 import json
 from typing import Dict, Any, List, Optional
+import os
 import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from urllib.parse import urlparse, parse_qs
+import lxml.html
+from common import gpt_num_tokens
+from tool_cache import cached_tool
 
-def search_pokemon_rankings() -> Dict[str, Any]:
-    """웹에서 포켓몬 랭킹 정보를 가져옵니다"""
+# Pokemon Home API 전용 세션 (쿠키와 User-Agent를 한 번만 설정하고 연결을 재사용)
+# User-Agent (PowerShell 덤프와 동일)
+pokemon_session = http_client.create_session(headers={
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/141.0.0.0 Safari/537.36"
+})
+pokemon_cookie_val = "faCZdSaSjmGpidTWyKHD/L4D1jixtHRGKmPN/diTxyJ+gcWYuPuucxTMylBdlU6OhhNQB5Bjo7y1wIrkhxafF0ZXXOaW4qD3rAd2BOd5AU6MqQIw4jVYKuVD9QDp"
+pokemon_session.cookies.set("AWSALB", pokemon_cookie_val, domain="api.battle.pokemon-home.com", path="/")
+pokemon_session.cookies.set("AWSALBCORS", pokemon_cookie_val, domain="api.battle.pokemon-home.com", path="/")
 
-    try:
-        # Pokemon Home으로부터 역공학된 주소
-        url = "https://resource.pokemon-home.com/battledata/t_rankmatch.html"
+POKEMON_SEASON_LIST_URL = "https://api.battle.pokemon-home.com/tt/cbd/competition/rankmatch/list"
+POKEMON_RANKING_URL = "https://resource.pokemon-home.com/battledata/ranking/scvi/{cid}/{rst}/{ts2}/pokemon"
+POKEMON_API_HEADERS = {
+    "accept": "application/json, text/javascript, */*; q=0.01",
+    "accept-encoding": "gzip, deflate, br, zstd",
+    "accept-language": "ko-KR,ko;q=0.9,en-US;q=0.8,en;q=0.7",
+    "authorization": "Bearer",
+    "cache-control": "no-cache",
+    "countrycode": "305",
+    "langcode": "8",
+    "origin": "https://resource.pokemon-home.com",
+    "pragma": "no-cache",
+    "priority": "u=1, i",
+    "referer": "https://resource.pokemon-home.com/",
+    "sec-ch-ua": '"Google Chrome";v="141", "Not?A_Brand";v="8", "Chromium";     v="141"',
+    "sec-ch-ua-mobile": "?0",
+    "sec-ch-ua-platform": '"Windows"',
+    "sec-fetch-dest": "empty",
+    "sec-fetch-mode": "cors",
+    "sec-fetch-site": "same-site",
+    "Content-Type": "application/json",
+}
+# 시즌 중에도 랭킹 스냅샷(ts2)이 갱신되므로, 시즌 종료 전이라도 이 시간이 지나면 시즌 정보를 다시 받음
+POKEMON_SEASON_REFRESH = 3 * 3600
+pokemon_season_cache = {'season': None, 'expires': 0.0}
 
-        # 세션 생성
-        session = requests.Session()
+def parse_season_end(value) -> Optional[float]:
+    """시즌 종료 시각 문자열을 timestamp로 변환 (형식을 모르면 None)"""
+    if not isinstance(value, str):
+        return None
+    for fmt in ('%Y/%m/%d %H:%M:%S', '%Y/%m/%d %H:%M', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S'):
+        try:
+            return datetime.strptime(value.strip(), fmt).timestamp()
+        except ValueError:
+            continue
+    return None
 
-        # User-Agent (PowerShell 덤프와 동일)
-        session.headers.update({
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/141.0.0.0 Safari/537.36"
-        })
+def get_pokemon_season() -> Optional[Dict[str, Any]]:
+    """최신 랭크배틀 시즌 정보 - 응답은 한 번만 파싱하고, 시즌이 끝나거나 갱신 주기가 지날 때까지 캐시"""
+    now = datetime.now().timestamp()
+    if pokemon_season_cache['season'] is not None and now < pokemon_season_cache['expires']:
+        return pokemon_season_cache['season']
 
-        cookie_val = "faCZdSaSjmGpidTWyKHD/L4D1jixtHRGKmPN/diTxyJ+gcWYuPuucxTMylBdlU6OhhNQB5Bjo7y1wIrkhxafF0ZXXOaW4qD3rAd2BOd5AU6MqQIw4jVYKuVD9QDp"
+    response = pokemon_session.post(POKEMON_SEASON_LIST_URL, headers=POKEMON_API_HEADERS, json={"soft": "Sc"}, timeout=http_client.DEFAULT_TIMEOUT)
+    if response.status_code != 200:
+        return None
 
-        session.cookies.set("AWSALB", cookie_val, domain="api.battle.pokemon-home.com", path="/")
-        session.cookies.set("AWSALBCORS", cookie_val, domain="api.battle.pokemon-home.com", path="/")
+    seasons = response.json()['list']
+    max_key = max(seasons.keys(), key=int)
+    print('> recent_season:', max_key)
+    season_id = list(seasons[max_key].keys())[-1]
+    info = seasons[max_key][season_id]
+    season = {'season': max_key, 'id': season_id, 'cId': info['cId'], 'rst': info['rst'], 'ts2': info['ts2'], 'end': info.get('end')}
 
-        
-        headers = {
-            "accept": "application/json, text/javascript, */*; q=0.01",
-            "accept-encoding": "gzip, deflate, br, zstd",
-            "accept-language": "ko-KR,ko;q=0.9,en-US;q=0.8,en;q=0.7",
-            "authorization": "Bearer",
-            "cache-control": "no-cache",
-            "countrycode": "305",
-            "langcode": "8",
-            "origin": "https://resource.pokemon-home.com",
-            "pragma": "no-cache",
-            "priority": "u=1, i",
-            "referer": "https://resource.pokemon-home.com/",
-            "sec-ch-ua": '"Google Chrome";v="141", "Not?A_Brand";v="8", "Chromium";     v="141"',
-            "sec-ch-ua-mobile": "?0",
-            "sec-ch-ua-platform": '"Windows"',
-            "sec-fetch-dest": "empty",
-            "sec-fetch-mode": "cors",
-            "sec-fetch-site": "same-site",
-            "Content-Type": "application/json",
-        }
-        json_body = {"soft": "Sc"}
-        # 요청 보내기
-        season_list_url = "https://api.battle.pokemon-home.com/tt/cbd/competition/rankmatch/list"
-        response = session.post(season_list_url, headers=headers, json=json_body)
-        if response.status_code == 200:
-            max_key = max(response.json()['list'].keys(), key=int)
-            print('> recent_season:', max_key)
-            season_id = list(response.json()['list'][max_key].keys())[-1]
-            cid = response.json()['list'][max_key][season_id]['cId']
-            rst = response.json()['list'][max_key][season_id]['rst']
-            ts2 = response.json()['list'][max_key][season_id]['ts2']
-            response = session.get(f"https://resource.pokemon-home.com/battledata/ranking/scvi/{cid}/{rst}/{ts2}/pokemon")
+    expires = now + POKEMON_SEASON_REFRESH
+    season_end = parse_season_end(info.get('end'))
+    if season_end is not None and season_end > now:
+        expires = min(expires, season_end)
+    pokemon_season_cache.update(season=season, expires=expires)
+    return season
+
+def iter_json_array(chunks):
+    """JSON 배열 응답을 청크 단위로 받으면서 원소를 하나씩 꺼냄 (끝까지 내려받지 않아도 됨)"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    for chunk in chunks:
+        buffer += chunk
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if not started:
+                if pos < len(buffer) and buffer[pos] == '[':
+                    started = True
+                    pos += 1
+                    continue
+                break
+            if pos < len(buffer) and buffer[pos] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                break    # 원소가 아직 다 도착하지 않음
+            if end == len(buffer) and not isinstance(item, (dict, list, str)):
+                break    # 숫자 등은 다음 청크에 이어질 수 있으므로 구분자를 본 뒤에 꺼냄
+            yield item
+            pos = end
+        buffer = buffer[pos:]
+
+def search_pokemon_rankings(top_n: int = 20) -> Dict[str, Any]:
+    """웹에서 포켓몬 랭킹 정보를 가져옵니다 (상위 top_n개를 구조화된 목록으로 반환)"""
 
+    try:
+        season = get_pokemon_season()
+        if season is None:
             return {
-                'content': f"포켓몬 전국도감 번호로 표기된 자료 입니다.\n{response.json()[:20]}",
+                'ok': False,
+                'content': '포켓몬 랭킹 데이터를 가져올 수 없습니다.',
                 'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             }
-        else:
+
+        # 랭킹 전체를 받지 않고 상위 top_n개가 파싱되면 연결을 닫음
+        url = POKEMON_RANKING_URL.format(cid=season['cId'], rst=season['rst'], ts2=season['ts2'])
+        rankings = []
+        with pokemon_session.get(url, stream=True, timeout=http_client.DEFAULT_TIMEOUT) as response:
+            response.raise_for_status()
+            response.encoding = response.encoding or 'utf-8'
+            for item in iter_json_array(response.iter_content(chunk_size=4096, decode_unicode=True)):
+                rankings.append({'rank': len(rankings) + 1, 'pokedex_no': item.get('id'), 'form': item.get('form')})
+                if len(rankings) >= top_n:
+                    break
+
+        if not rankings:
+            # JSON 배열이 아닌 응답(점검 페이지 등)은 성공으로 캐시되지 않도록 실패로 처리
             return {
-                'content': '포켓몬 랭킹 데이터를 가져올 수 없습니다.',
+                'ok': False,
+                'content': '포켓몬 랭킹 데이터를 가져올 수 없습니다. (응답에 랭킹 항목이 없음)',
                 'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             }
+
+        return {
+            'content': f"포켓몬 전국도감 번호로 표기된 시즌 {season['season']} 사용률 상위 {len(rankings)}위 자료 입니다.\n"
+                       + json.dumps(rankings, ensure_ascii=False),
+            'season': season['season'],
+            'rankings': rankings,
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
     except Exception as e:
         return {
+            'ok': False,
             'content': f"포켓몬 통계 오류: {str(e)}",
             'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
 
-def search_web(query: str) -> Dict[str, Any]:
-    """웹에서 정보를 검색합니다 - 원본 HTML을 그대로 반환해서 OpenAI가 분석하게 함"""
+SEARCH_RESULT_TOKEN_BUDGET = 800    # 검색 결과 목록을 모델에 넘길 때의 최대 토큰 수
+SEARCH_SNIPPET_MAX_CHARS = 300
+
+def _clean_text(text) -> str:
+    return ' '.join((text or '').split())
+
+def _unwrap_redirect(href: str) -> str:
+    """검색엔진 리다이렉트 링크(/url?q=..., //duckduckgo.com/l/?uddg=...)에서 실제 주소를 꺼냄"""
+    if href.startswith('//'):
+        href = 'https:' + href
+    parsed = urlparse(href)
+    params = parse_qs(parsed.query)
+    for key in ('q', 'uddg', 'url'):
+        if key in params and params[key][0].startswith('http'):
+            return params[key][0]
+    return href
+
+def _result(title, url, snippet) -> Optional[Dict[str, str]]:
+    title = _clean_text(title)
+    url = _unwrap_redirect(url or '')
+    if not title or not url.startswith('http'):
+        return None
+    snippet = _clean_text(snippet)
+    if snippet.startswith(title):
+        snippet = snippet[len(title):].strip()
+    return {'title': title, 'url': url, 'snippet': snippet[:SEARCH_SNIPPET_MAX_CHARS]}
+
+def extract_google_results(tree) -> List[Dict[str, str]]:
+    results = []
+    for link in tree.xpath('//a[.//h3]'):
+        # 제목 링크를 감싼 블록 중 설명이 들어 있을 만큼 큰 가장 가까운 블록을 요약으로 사용
+        title = link.xpath('string(.//h3)')
+        container = link
+        for _ in range(4):
+            parent = container.getparent()
+            if parent is None:
+                break
+            container = parent
+            if len(_clean_text(container.text_content())) > len(_clean_text(title)) + 40:
+                break
+        results.append(_result(title, link.get('href'), container.text_content()))
+    return [r for r in results if r and 'google.' not in urlparse(r['url']).netloc]
+
+def extract_duckduckgo_results(tree) -> List[Dict[str, str]]:
+    results = []
+    for block in tree.xpath('//div[contains(concat(" ", normalize-space(@class), " "), " result ")]'):
+        links = block.xpath('.//a[contains(@class, "result__a")]')
+        if not links:
+            continue
+        snippet = block.xpath('string(.//*[contains(@class, "result__snippet")])')
+        results.append(_result(links[0].text_content(), links[0].get('href'), snippet))
+    return [r for r in results if r]
+
+def extract_naver_results(tree) -> List[Dict[str, str]]:
+    results = []
+    title_xpath = ('//a[contains(@class, "link_tit") or contains(@class, "title_link") '
+                   'or contains(@class, "total_tit") or contains(@class, "news_tit")]')
+    for link in tree.xpath(title_xpath):
+        block = link.getparent()
+        for _ in range(3):
+            if block is None or block.xpath('.//*[contains(@class, "dsc")]'):
+                break
+            block = block.getparent()
+        snippet = block.xpath('string(.//*[contains(@class, "dsc")])') if block is not None else ''
+        results.append(_result(link.get('title') or link.text_content(), link.get('href'), snippet))
+    return [r for r in results if r]
+
+def format_search_results(results, token_budget=SEARCH_RESULT_TOKEN_BUDGET):
+    """순위대로 결과를 붙이되 gpt_num_tokens로 잰 전체 길이가 예산을 넘기 전까지만 포함"""
+    lines = []
+    used = 0
+    included = []
+    for rank, result in enumerate(results, 1):
+        line = f"{rank}. {result['title']}\n   {result['snippet']}\n   {result['url']}"
+        tokens = gpt_num_tokens([{'content': line}])
+        if used + tokens > token_budget:
+            break
+        used += tokens
+        lines.append(line)
+        included.append(result)
+    return '\n'.join(lines), included
+
+def _dedupe(results):
+    seen = set()
+    unique = []
+    for result in results:
+        if result['url'] in seen:
+            continue
+        seen.add(result['url'])
+        unique.append(result)
+    return unique
+
+SEARCH_ENGINES = [
+    ('Google', 'https://www.google.com/search?q={query}&hl=ko&gl=kr', extract_google_results),
+    ('DuckDuckGo', 'https://html.duckduckgo.com/html/?q={query}', extract_duckduckgo_results),
+    ('네이버', 'https://search.naver.com/search.naver?query={query}', extract_naver_results),
+]
+SEARCH_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'ko-KR,ko;q=0.8,en-US;q=0.5,en;q=0.3',
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+}
+# 'hedged': 앞 엔진이 SEARCH_HEDGE_DELAY 안에 답하지 않으면 다음 엔진도 시작, 'all': 처음부터 모두 시작
+SEARCH_HEDGE_MODE = os.getenv('SEARCH_HEDGE_MODE', 'hedged')
+SEARCH_HEDGE_DELAY = 1.5    # 초
+SEARCH_DEADLINE = 15        # 초
+
+search_pool = ThreadPoolExecutor(max_workers=6, thread_name_prefix='search')
+
+class SearchEngineHealth:
+    """검색엔진별 연속 실패 수를 기록하고, failure_threshold번 연속 실패한 엔진은 demote_seconds 동안 뒤로 미룸"""
+
+    def __init__(self, failure_threshold: int = 3, demote_seconds: int = 300):
+        self.failure_threshold = failure_threshold
+        self.demote_seconds = demote_seconds
+        self.failures = {}
+        self.demoted_until = {}
+        self.lock = threading.Lock()
+
+    def record(self, name: str, ok: bool):
+        with self.lock:
+            if ok:
+                self.failures[name] = 0
+                self.demoted_until.pop(name, None)
+                return
+            self.failures[name] = self.failures.get(name, 0) + 1
+            if self.failures[name] >= self.failure_threshold:
+                self.demoted_until[name] = time.time() + self.demote_seconds
+                print(f"{name} search demoted for {self.demote_seconds}s")
+
+    def is_demoted(self, name: str) -> bool:
+        with self.lock:
+            return self.demoted_until.get(name, 0) > time.time()
+
+    def order(self, engines):
+        """강등되지 않은 엔진을 원래 우선순위대로 앞에, 강등된 엔진은 뒤에"""
+        return sorted(engines, key=lambda engine: (self.is_demoted(engine[0]), engines.index(engine)))
+
+search_health = SearchEngineHealth()
+
+def _search_engine(engine, query, cancelled) -> Optional[Dict[str, Any]]:
+    """엔진 하나로 검색해서 결과를 반환 (실패하거나 결과가 없으면 None)"""
+    name, url_format, extract = engine
+    search_url = url_format.format(query=requests.utils.quote(query))
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'ko-KR,ko;q=0.8,en-US;q=0.5,en;q=0.3',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
+        response = http_client.get(search_url, headers=SEARCH_HEADERS)
+        if cancelled.is_set():
+            return None    # 다른 엔진이 이미 답함 - 파싱하지 않음
+        if response.status_code != 200:
+            print(f"{name} search status: {response.status_code}")
+            search_health.record(name, False)
+            return None
+        results = _dedupe(extract(lxml.html.fromstring(response.content)))
+        search_health.record(name, bool(results))
+        if not results:
+            print(f"{name} search: no results parsed")
+            return None
+
+        content, included = format_search_results(results)
+        return {
+            'query': query,
+            'content': f"[{name} 검색 결과]\n검색 쿼리: {query}\n\n{content}",
+            'results': included,
+            'source_url': search_url,
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
+    except Exception as e:
+        print(f"{name} search error: {e}")
+        search_health.record(name, False)
+        return None
+
+def search_web(query: str) -> Dict[str, Any]:
+    """웹에서 정보를 검색합니다 - 검색 결과 페이지에서 제목/요약/주소만 뽑아 토큰 예산 안의 순위 목록으로 반환
+
+    여러 엔진에 시간차로(hedged) 요청해서 가장 먼저 온 좋은 결과를 쓰고 나머지는 취소한다.
+    """
+    try:
+        pending = search_health.order(SEARCH_ENGINES)
+        cancelled = threading.Event()
+        futures = {}
+        deadline = time.time() + SEARCH_DEADLINE
+
+        def launch():
+            engine = pending.pop(0)
+            futures[search_pool.submit(_search_engine, engine, query, cancelled)] = engine[0]
+
+        launch()
+        while SEARCH_HEDGE_MODE == 'all' and pending:
+            launch()
+
+        while futures:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            timeout = min(SEARCH_HEDGE_DELAY, remaining) if pending else remaining
+            done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                futures.pop(future)
+                result = future.result()
+                if result is not None:
+                    # 먼저 도착한 결과 사용, 시작 전인 요청은 취소하고 진행 중인 요청은 파싱을 건너뜀
+                    cancelled.set()
+                    for other in futures:
+                        other.cancel()
+                    return result
+
+            # 앞 엔진이 SEARCH_HEDGE_DELAY 안에 답하지 않았거나 실패했으면 다음 엔진 시작
+            if pending:
+                launch()
         
-        # Google 검색 수행
-        search_url = f"https://www.google.com/search?q={requests.utils.quote(query)}&hl=ko&gl=kr"
-        
-        try:
-            response = requests.get(search_url, headers=headers, timeout=15)
-            if response.status_code == 200:
-                # 원본 HTML을 그대로 반환 (길이 제한)
-                html_content = response.text
-                
-                # HTML이 너무 길면 일부만 자르기 (OpenAI 토큰 제한 고려)
-                if len(html_content) > 8000:
-                    html_content = html_content[:8000] + "\n\n[HTML 내용이 길어서 일부만 표시됨]"
-                
-                return {
-                    'query': query,
-                    'content': f"[Google 검색 결과 HTML]\n검색 쿼리: {query}\n검색 URL: {search_url}\n\n{html_content}",
-                    'source_url': search_url,
-                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                }
-        except Exception as e:
-            print(f"Google search error: {e}")
-        
-        # 백업: DuckDuckGo 검색 
-        try:
-            ddg_url = f"https://html.duckduckgo.com/html/?q={requests.utils.quote(query)}"
-            response = requests.get(ddg_url, headers=headers, timeout=10)
-            if response.status_code == 200:
-                html_content = response.text
-                
-                # HTML 길이 제한
-                if len(html_content) > 6000:
-                    html_content = html_content[:6000] + "\n\n[HTML 내용이 길어서 일부만 표시됨]"
-                
-                return {
-                    'query': query,
-                    'content': f"[DuckDuckGo 검색 결과 HTML]\n검색 쿼리: {query}\n검색 URL: {ddg_url}\n\n{html_content}",
-                    'source_url': ddg_url,
-                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                }
-        except Exception as e:
-            print(f"DuckDuckGo search error: {e}")
-        
-        # 마지막 백업: 네이버 검색
-        try:
-            naver_url = f"https://search.naver.com/search.naver?query={requests.utils.quote(query)}"
-            response = requests.get(naver_url, headers=headers, timeout=10)
-            if response.status_code == 200:
-                html_content = response.text
-                
-                # HTML 길이 제한  
-                if len(html_content) > 6000:
-                    html_content = html_content[:6000] + "\n\n[HTML 내용이 길어서 일부만 표시됨]"
-                
-                return {
-                    'query': query,
-                    'content': f"[네이버 검색 결과 HTML]\n검색 쿼리: {query}\n검색 URL: {naver_url}\n\n{html_content}",
-                    'source_url': naver_url,
-                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                }
-        except Exception as e:
-            print(f"Naver search error: {e}")
-        
+        cancelled.set()
         return {
             'query': query,
-            'content': f"'{query}'에 대한 웹 검색을 수행했지만 HTML 내용을 가져올 수 없었습니다. 네트워크 연결을 확인해주세요.",
+            'ok': False,
+            'content': f"'{query}'에 대한 웹 검색을 수행했지만 검색 결과를 가져올 수 없었습니다. 네트워크 연결을 확인해주세요.",
             'source_url': "",
             'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
@@ -162,6 +388,7 @@ def search_web(query: str) -> Dict[str, Any]:
     except Exception as e:
         return {
             'query': query,
+            'ok': False,
             'content': f"웹 검색 중 오류가 발생했습니다: {str(e)}",
             'source_url': "",
             'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -178,7 +405,7 @@ def get_weather(city: str = "서울") -> Dict[str, Any]:
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
         
-        response = requests.get(url, headers=headers, timeout=10)
+        response = http_client.get(url, headers=headers)
         
         if response.status_code == 200:
             data = response.json()
@@ -207,7 +434,7 @@ def get_weather(city: str = "서울") -> Dict[str, Any]:
             search_query = f"{city} weather"
             google_url = f"https://www.google.com/search?q={search_query}"
             
-            response = requests.get(google_url, headers=headers, timeout=10)
+            response = http_client.get(google_url, headers=headers)
             soup = BeautifulSoup(response.content, 'html.parser')
             
             weather_info = {}
@@ -238,6 +465,7 @@ def get_weather(city: str = "서울") -> Dict[str, Any]:
             else:
                 return {
                     'city': city,
+                    'ok': False,
                     'content': f"{city}의 날씨 정보를 가져올 수 없습니다.",
                     'weather_data': {},
                     'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -246,6 +474,7 @@ def get_weather(city: str = "서울") -> Dict[str, Any]:
     except Exception as e:
         return {
             'city': city,
+            'ok': False,
             'content': f"{city} 날씨 정보를 가져오는 중 오류가 발생했습니다: {str(e)}",
             'weather_data': {},
             'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -265,7 +494,7 @@ def get_news(topic: str = "기술") -> Dict[str, Any]:
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
         
-        response = requests.get(search_url, headers=headers, timeout=15)
+        response = http_client.get(search_url, headers=headers)
         soup = BeautifulSoup(response.content, 'html.parser')
         
         news_items = []
@@ -310,6 +539,7 @@ def get_news(topic: str = "기술") -> Dict[str, Any]:
             content = f"{topic} 관련 뉴스를 네이버에서 찾고 있지만 파싱에 어려움이 있습니다. 직접 네이버 뉴스에서 확인해주세요."
             
         return {
+            'ok': bool(news_items),
             'topic': topic,
             'content': content,
             'news_items': news_items[:5] if news_items else [],
@@ -319,6 +549,7 @@ def get_news(topic: str = "기술") -> Dict[str, Any]:
     except Exception as e:
         return {
             'topic': topic,
+            'ok': False,
             'content': f"{topic} 뉴스 정보를 가져오는 중 오류가 발생했습니다: {str(e)}",
             'news_items': [],
             'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -341,6 +572,7 @@ def get_current_time(timezone: str = "KST") -> Dict[str, Any]:
     except Exception as e:
         return {
             'timezone': timezone,
+            'ok': False,
             'content': f"시간 정보를 가져오는 중 오류가 발생했습니다: {str(e)}",
             'formatted_time': "",
             'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -352,12 +584,13 @@ def get_stock_info(symbol: str) -> Dict[str, Any]:
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
+        ok = True    # 정보를 찾지 못한 경우 False (실패 결과는 캐시하지 않음)
         
         # 환율 정보
         if symbol.upper() in ['USD', 'DOLLAR', '달러']:
             # 네이버 환율 페이지에서 USD/KRW 정보 가져오기
             url = "https://finance.naver.com/marketindex/exchangeDetail.nhn?marketindexCd=FX_USDKRW"
-            response = requests.get(url, headers=headers, timeout=10)
+            response = http_client.get(url, headers=headers)
             soup = BeautifulSoup(response.content, 'html.parser')
             
             # 환율 정보 추출
@@ -367,10 +600,11 @@ def get_stock_info(symbol: str) -> Dict[str, Any]:
                 content = f"USD/KRW 환율: {rate}원"
             else:
                 content = "USD 환율 정보를 가져올 수 없습니다."
+                ok = False
                 
         elif symbol.upper() in ['EUR', '유로']:
             url = "https://finance.naver.com/marketindex/exchangeDetail.nhn?marketindexCd=FX_EURKRW"
-            response = requests.get(url, headers=headers, timeout=10)
+            response = http_client.get(url, headers=headers)
             soup = BeautifulSoup(response.content, 'html.parser')
             
             rate_elem = soup.select_one('.head_info .blind')
@@ -379,10 +613,11 @@ def get_stock_info(symbol: str) -> Dict[str, Any]:
                 content = f"EUR/KRW 환율: {rate}원"
             else:
                 content = "EUR 환율 정보를 가져올 수 없습니다."
+                ok = False
                 
         elif symbol.upper() in ['JPY', '엔']:
             url = "https://finance.naver.com/marketindex/exchangeDetail.nhn?marketindexCd=FX_JPYKRW"  
-            response = requests.get(url, headers=headers, timeout=10)
+            response = http_client.get(url, headers=headers)
             soup = BeautifulSoup(response.content, 'html.parser')
             
             rate_elem = soup.select_one('.head_info .blind')
@@ -391,6 +626,7 @@ def get_stock_info(symbol: str) -> Dict[str, Any]:
                 content = f"JPY/KRW 환율: {rate}원 (100엔 기준)"
             else:
                 content = "JPY 환율 정보를 가져올 수 없습니다."
+                ok = False
                 
         else:
             # 주식 정보 - Yahoo Finance에서 가져오기 시도
@@ -402,7 +638,7 @@ def get_stock_info(symbol: str) -> Dict[str, Any]:
                     symbol = '000660.KS'
                     
                 url = f"https://query1.finance.yahoo.com/v8/finance/chart/{symbol}"
-                response = requests.get(url, headers=headers, timeout=10)
+                response = http_client.get(url, headers=headers)
                 
                 if response.status_code == 200:
                     data = response.json()
@@ -416,12 +652,16 @@ def get_stock_info(symbol: str) -> Dict[str, Any]:
                         content = f"{symbol} 주가: ${current_price:.2f} (전일대비 {change:+.2f})"
                     else:
                         content = f"{symbol} 주식 정보를 찾을 수 없습니다."
+                        ok = False
                 else:
                     content = f"{symbol} 주식 정보에 접근할 수 없습니다."
+                    ok = False
             except:
                 content = f"{symbol}의 금융 정보를 가져올 수 없습니다. 정확한 심볼을 확인해주세요."
+                ok = False
         
         return {
+            'ok': ok,
             'symbol': symbol,
             'content': content,
             'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -430,6 +670,7 @@ def get_stock_info(symbol: str) -> Dict[str, Any]:
     except Exception as e:
         return {
             'symbol': symbol,
+            'ok': False,
             'content': f"{symbol} 금융 정보를 가져오는 중 오류가 발생했습니다: {str(e)}",
             'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
@@ -516,14 +757,23 @@ FUNCTION_DEFINITIONS = [
 ]
 
 
+# 함수별 결과 캐시 유지 시간(초) - 데이터가 바뀌는 주기에 맞춤, get_current_time은 캐시하지 않음
+TOOL_CACHE_TTLS = {
+    "search_pokemon_rankings": POKEMON_SEASON_REFRESH,    # 시즌 정보 갱신 주기와 맞춤
+    "search_web": 10 * 60,
+    "get_weather": 10 * 60,
+    "get_news": 5 * 60,
+    "get_stock_info": 60,                   # 환율/주가
+}
+
 # 함수 이름과 실제 함수 매핑
 FUNCTION_MAP = {
-    "search_pokemon_rankings": search_pokemon_rankings,
-    "search_web": search_web,
-    "get_weather": get_weather,
-    "get_news": get_news,
+    "search_pokemon_rankings": cached_tool(search_pokemon_rankings, TOOL_CACHE_TTLS["search_pokemon_rankings"]),
+    "search_web": cached_tool(search_web, TOOL_CACHE_TTLS["search_web"], cacheable=lambda r: bool(r.get('source_url'))),
+    "get_weather": cached_tool(get_weather, TOOL_CACHE_TTLS["get_weather"]),
+    "get_news": cached_tool(get_news, TOOL_CACHE_TTLS["get_news"]),
     "get_current_time": get_current_time,
-    "get_stock_info": get_stock_info
+    "get_stock_info": cached_tool(get_stock_info, TOOL_CACHE_TTLS["get_stock_info"])
 }
 
 if __name__ == "__main__":
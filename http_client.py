@@ -0,0 +1,54 @@
+"""
+function_tools의 스크래퍼들이 함께 쓰는 HTTP 클라이언트 (호스트별 keep-alive 연결 풀, 재시도, 공통 타임아웃)
+"""
+
+import os
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_TIMEOUT = (3.05, 10)    # (연결, 읽기) 초
+POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', '16'))    # 연결 풀을 유지할 호스트 수
+POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '16'))            # 호스트당 유지할 연결 수
+MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', '2'))
+RETRY_BACKOFF_MAX = 2.0    # 재시도 간 대기 상한(초) - 도구 타임아웃(TOOL_TIMEOUTS) 안에 끝나도록
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept-Language': 'ko-KR,ko;q=0.9,en-US;q=0.8,en;q=0.7',
+}
+
+def create_session(headers=None, retries=MAX_RETRIES, backoff_factor=0.3, pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE):
+    """연결 풀과 재시도(429/5xx, 연결 오류)가 설정된 requests.Session 생성
+
+    읽기 타임아웃은 재시도하지 않고(느린 서버를 세 번 기다리지 않도록), Retry-After 대신 상한이 있는 백오프를 쓴다.
+    """
+    session = requests.Session()
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=0,
+        backoff_factor=backoff_factor,
+        backoff_max=RETRY_BACKOFF_MAX,
+        status_forcelist=(429, 500, 502, 503, 504),
+        respect_retry_after_header=False,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update(DEFAULT_HEADERS)
+    if headers:
+        session.headers.update(headers)
+    return session
+
+# 모든 도구가 공유하는 세션 - wttr.in, 네이버, 야후 등에 대한 연결을 재사용
+session = create_session()
+
+def get(url, **kwargs):
+    kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+    return session.get(url, **kwargs)
+
+def post(url, **kwargs):
+    kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+    return session.post(url, **kwargs)
@@ -1,46 +1,45 @@
 import os
 import json
-from pymongo import MongoClient
-from pinecone.grpc import PineconeGRPC as Pinecone
+import argparse
 from dotenv import load_dotenv
 
 load_dotenv()
-from openai import OpenAI
+from common import client
+from memory_manager import mongo_memory_collection, embedding_model, ingest_memories, EMBED_BATCH_SIZE, UPSERT_BATCH_SIZE, MONGO_BATCH_SIZE
+from embedding_cache import EmbeddingCache
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+parser = argparse.ArgumentParser(description='대화내용요약.json의 요약을 기억(Pinecone + Mongo)으로 일괄 저장')
+parser.add_argument('--input', default='대화내용요약.json')
+parser.add_argument('--embed-batch-size', type=int, default=EMBED_BATCH_SIZE)
+parser.add_argument('--upsert-batch-size', type=int, default=UPSERT_BATCH_SIZE)
+parser.add_argument('--mongo-batch-size', type=int, default=MONGO_BATCH_SIZE)
+args = parser.parse_args()
 
-pinecone = Pinecone(api_key=os.getenv('PINECONE_API_KEY'))
-pinecone_index = pinecone.Index('agent-memory')
+# 다시 넣을 때 같은 요약은 임베딩을 재사용하도록 파일 캐시 사용
+embedding_cache = EmbeddingCache(client, embedding_model, db_path=os.getenv('EMBEDDING_CACHE_PATH', 'embedding_cache.db'))
 
-mongo_cluster = MongoClient(os.getenv('MONGO_CLUSTER_URI'))
-mongo_memory_collection = mongo_cluster['OPENAI_AGENT_CHAT']['memory']
-
-embedding_model = 'text-embedding-ada-002'
-
-with open('대화내용요약.json', 'r', encoding='utf-8') as f:
+with open(args.input, 'r', encoding='utf-8') as f:
     summaries_list = json.load(f)
 
 mongo_memory_collection.delete_many({})
 
+docs = []
 next_id = 1
 
 for list_idx, summaries in enumerate(summaries_list):
     date = f'202511{list_idx+1:02}'
 
     for summary in summaries:
-        vector = client.embeddings.create(
-            input=summary['요약'],
-            model=embedding_model
-        ).data[0].embedding
-
-        metadata = {'date': date, 'keyword': summary['주제']}
-        upsert_response = pinecone_index.upsert([(str(next_id), vector, metadata)])
-
-        query = {'_id': next_id}
-        newvalues = {'$set': {'date': date, 'keyword': summary['주제'],  'summary': summary['요약']}} 
-        mongo_memory_collection.update_one(query, newvalues, upsert=True)
-        
-        if (next_id) % 5 == 0:    
-            print(f'id: {next_id}')
-            
+        docs.append({'_id': next_id, 'date': date, 'keyword': summary['주제'], 'summary': summary['요약']})
         next_id += 1
+
+ingest_memories(
+    docs,
+    cache=embedding_cache,
+    embed_batch_size=args.embed_batch_size,
+    upsert_batch_size=args.upsert_batch_size,
+    mongo_batch_size=args.mongo_batch_size
+)
+
+print(f'embedding cache: hit {embedding_cache.hits}, miss {embedding_cache.misses}')
+embedding_cache.close()
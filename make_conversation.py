@@ -1,6 +1,10 @@
 import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from common import client, model
 
+SPEAKERS = {'브라이언', '테오'}
+
 prompt = """
 -브라이언과 인공지능 챗봇 친구인 테오 사이의 대화 데이터를 만들어야 합니다.
 -출력은 아래와 같은 JSON 형태입니다.
@@ -44,28 +48,63 @@ instruction =
 문제에 대한 해결을 요청하는 대화인 경우 프로그래밍 이슈 관련 질문에 해당하며, 이 이외에 일반적인 프로그래밍 대화는 일상적인 대화입니다.
 """
 
-conversations = []
-successful_runs = 0
-while successful_runs < 5:
-    try:
-        response = client.responses.create(
-            model=model.basic,
-            input=[
-                {"role": "developer", "content": "당신은 '개발 파트너 테오'입니다.\n- 역할: 사용자의 프로그래밍 실습을 함께 해결하는 시니어 개발 동료\n- 톤: 친절하고 침착한 존댓말, 핵심 위주"},
-                {"role": "user", "content": prompt}
-            ]
-        )
-        content = response.output_text
-        print(content)
+def generate():
+    """대화 데이터 1세트를 생성하고 검증해서 반환 (형식이 맞지 않으면 예외)"""
+    response = client.responses.create(
+        model=model.basic,
+        input=[
+            {"role": "developer", "content": "당신은 '개발 파트너 테오'입니다.\n- 역할: 사용자의 프로그래밍 실습을 함께 해결하는 시니어 개발 동료\n- 톤: 친절하고 침착한 존댓말, 핵심 위주"},
+            {"role": "user", "content": prompt}
+        ]
+    )
+    content = response.output_text
+
+    #JSON 로드
+    conversation = json.loads(content)['data']
+    if not conversation or not all(isinstance(turn, dict) and len(turn) == 1 and set(turn) <= SPEAKERS for turn in conversation):
+        raise ValueError('대화 형식이 올바르지 않습니다.')
+    return conversation
+
+def main():
+    parser = argparse.ArgumentParser(description='브라이언과 테오의 대화 데이터 생성')
+    parser.add_argument('--count', type=int, default=5, help='생성할 대화 세트 수')
+    parser.add_argument('--concurrency', type=int, default=4, help='동시에 보내는 생성 요청 수')
+    parser.add_argument('--output', default='대화원천내용.json', help='전체를 하나의 JSON 배열로 저장할 파일')
+    parser.add_argument('--jsonl', help='지정하면 검증된 대화를 한 줄씩 바로 기록 (메모리에 모아두지 않음)')
+    args = parser.parse_args()
+
+    conversations = []
+    out = open(args.jsonl, 'a', encoding='utf-8') if args.jsonl else None
+    successful_runs = 0
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        in_flight = {executor.submit(generate) for _ in range(min(args.concurrency, args.count))}
+        while in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    conversation = future.result()
+                except Exception as e:
+                    print(f"Error during API call: {e}")
+                    conversation = None
+
+                if conversation is not None and successful_runs < args.count:
+                    if out:
+                        out.write(json.dumps(conversation, ensure_ascii=False) + '\n')
+                        out.flush()
+                    else:
+                        conversations.append(conversation)
+                    successful_runs += 1
+                    print(f'{successful_runs}번째 종료\n')
+
+            # 실패한 요청은 다시 채워서 목표 개수를 맞춤
+            while successful_runs + len(in_flight) < args.count:
+                in_flight.add(executor.submit(generate))
 
-        #JSON 로드
-        conversation = json.loads(content)['data']
-        print(f'{successful_runs}번째 종료\n')
-        conversations.append(conversation)
-        successful_runs += 1
-    except Exception as e:
-        print(f"Error during API call: {e}")
-        continue
+    if out:
+        out.close()
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(conversations, f, ensure_ascii=False, indent=4)
 
-with open("대화원천내용.json", "w", encoding="utf-8") as f:
-    json.dump(conversations, f, ensure_ascii=False, indent=4)
\ No newline at end of file
+if __name__ == '__main__':
+    main()
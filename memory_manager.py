@@ -1,11 +1,21 @@
 
 import os
+import re
 import json
-from pprint import pprint
+import math
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pymongo import UpdateOne
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
-from common import today, client, model, today, yesterday
+from common import today, client, model, today, yesterday, gpt_num_tokens
 from pinecone.grpc import PineconeGRPC as Pinecone
+from embedding_cache import EmbeddingCache
+from retry import retry_call
+from chat_persistence import ChatWriter
+from conversation import ChatMessage
 # dotenv 설정 로드
 from dotenv import load_dotenv
 load_dotenv()
@@ -20,8 +30,45 @@ mongo_cluster = MongoClient(uri, server_api=ServerApi('1'))
 mongo_chats_collection = mongo_cluster['OPENAI_AGENT_CHAT']['chats']
 mongo_memory_collection = mongo_cluster['OPENAI_AGENT_CHAT']['memory']
 
+# 대화 메시지는 요청 스레드에서 바로 쓰지 않고 백그라운드 writer가 모아서 insert_many
+chat_writer = ChatWriter(
+    mongo_chats_collection,
+    batch_size=int(os.getenv('CHAT_WRITE_BATCH_SIZE', '100')),
+    flush_interval=float(os.getenv('CHAT_FLUSH_INTERVAL', '1.0')),
+    spool_path=os.getenv('CHAT_SPOOL_PATH', 'unsaved_chats.jsonl')
+)
+
 embedding_model = 'text-embedding-ada-002'
 
+# 질의/요약 임베딩 캐시 (EMBEDDING_CACHE_PATH를 지정하면 SQLite 파일에도 저장)
+embedding_cache = EmbeddingCache(
+    client, embedding_model,
+    db_path=os.getenv('EMBEDDING_CACHE_PATH'),
+    max_db_bytes=int(os.getenv('EMBEDDING_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+)
+
+# 요약 원문을 벡터 메타데이터에도 넣어 검색 시 Mongo 조회를 생략 (Mongo는 재구축용 원본으로 유지)
+STORE_SUMMARY_IN_METADATA = os.getenv('STORE_SUMMARY_IN_METADATA', 'true').lower() == 'true'
+METADATA_SUMMARY_MAX_BYTES = 8000    # Pinecone 메타데이터 한도(40KB)보다 충분히 작게
+
+# 기억 일괄 저장 시 단계별 묶음 크기와 묶음별 재시도 횟수
+EMBED_BATCH_SIZE = int(os.getenv('EMBED_BATCH_SIZE', '100'))
+UPSERT_BATCH_SIZE = int(os.getenv('UPSERT_BATCH_SIZE', '100'))
+MONGO_BATCH_SIZE = int(os.getenv('MONGO_BATCH_SIZE', '500'))
+CHAT_READ_BATCH_SIZE = int(os.getenv('CHAT_READ_BATCH_SIZE', '500'))    # 기억 통합 시 한 번에 읽어올 대화 수
+
+# 하루 대화 요약(map-reduce) 설정
+SUMMARY_CHUNK_TOKENS = int(os.getenv('SUMMARY_CHUNK_TOKENS', '6000'))    # 요약 호출 하나에 넣을 대화/부분 요약의 토큰 수
+SUMMARY_WORKERS = int(os.getenv('SUMMARY_WORKERS', '4'))
+SUMMARY_TRIES = 3
+INGEST_TRIES = 3
+
+# 기억 요약 문서 캐시 (_id -> (만료 시각, 문서)), save_to_memory에서 갱신
+MEMORY_CACHE_SIZE = 1024
+MEMORY_CACHE_TTL = 3600
+memory_cache = OrderedDict()
+memory_cache_lock = threading.Lock()
+
 # 아래 사용자 질의가 오늘 이전의 기억에 대해 묻는 것인지 참/거짓으로만 응답하세요.
 NEEDS_MEMORY_TEMPLATE = """
 아래 사용자 질의가 오늘 이전의 기억에 대해 묻는 것인지 TRUE/FALSE으로만 응답하세요. 현재 대화맥락에서 더 과거를 의미하는 경우에는 기억을 찾을 필요가 있으니 TRUE로 응답하는것을 권장합니다.
@@ -29,6 +76,151 @@ NEEDS_MEMORY_TEMPLATE = """
 {message}
 """
 
+# 지난 대화를 되묻는 것이 확실한 표현 (기억나?, 얘기했었지, 알려줬던 등) - 오탐이 적은 것만
+MEMORY_STRONG_PATTERN = re.compile(
+    r'(기억\s*(이\s*)?(안\s*)?나(\?|요|니|냐|지|세요|\s|$)|기억\s*하고\s*있'
+    r'|(말|얘기|이야기|대화)\s*(를\s*)?(했었|했던|했지|했더라|나눴|나누었)'
+    r'|(물어|알려|추천해|말해|가르쳐)\s*(봤었|봤던|줬었|줬던|줬지|줬더라))'
+)
+# 과거를 가리킬 수도 있는 표현 - 날씨, 일정 등 일반 질문에도 쓰이므로 판단은 임베딩/LLM에 넘기고 벡터 검색만 미리 시작
+MEMORY_WEAK_PATTERN = re.compile(
+    r'(어제|그저께|그제|엊그제|지난\s*(번|주|달|해|시간|주말)|저번|예전에|옛날에'
+    r'|(하루|이틀|사흘|며칠|일주일|한\s*달|몇\s*(일|주|달)|\d+\s*(일|주|달|개월|년))\s*전'
+    r'|전에|그때|했던|었던|았던|줬던|봤던|우리가|아까|내가|네가|까먹|잊어버렸)'
+)
+
+# 임베딩 유사도 판단용 예시 질의 (use_embedding_gate, 기본 사용) - 분명한 일반 질의는 LLM 없이 걸러냄
+MEMORY_EXEMPLARS = [
+    '우리 예전에 무슨 얘기 했었지?',
+    '저번에 알려준 방법 다시 말해줘',
+    '지난번에 내가 물어본 에러 기억나?',
+    '전에 같이 만들었던 코드 뭐였지?',
+    '그때 추천해준 책 이름이 뭐였더라',
+    '우리 뭐 하기로 했었지?',
+    '내가 전에 말한 거 뭐였지?',
+    '어제 우리가 나눈 대화 요약해줘',
+]
+NON_MEMORY_EXEMPLARS = [
+    '안녕? 오늘 기분 어때?',
+    '파이썬에서 리스트 정렬하는 방법 알려줘',
+    '서울 날씨 어때?',
+    'pip install 하다가 에러가 났어',
+    '이 코드 어디가 잘못됐는지 봐줘',
+    '오늘 뉴스 알려줘',
+    '애플 주가 얼마야?',
+    '지금 몇 시야?',
+    '포켓몬 랭킹 보여줘',
+    '점심 메뉴 추천해줘',
+    '고마워!',
+]
+
+def classify_memory_need(message):
+    """규칙 기반 1차 판단 - 지난 대화를 묻는 것이 확실하면 True, 그 외에는 None(임베딩/LLM 판단으로 넘김)
+
+    키워드가 없다고 기억 질의가 아니라고 단정할 수 없으므로(예: '우리 뭐 먹기로 했지?') False는 돌려주지 않는다.
+    """
+    if MEMORY_STRONG_PATTERN.search(message):
+        return True
+    return None
+
+def cosine_similarity(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+def vector_metadata(date, keyword, summary, session_id=None):
+    """기억 벡터의 메타데이터 - 요약이 너무 길면 잘라서 넣고 summary_truncated로 표시, 세션 기억이면 session_id 포함"""
+    metadata = {'date': date, 'keyword': keyword}
+    if session_id is not None:
+        metadata['session_id'] = session_id
+    if STORE_SUMMARY_IN_METADATA:
+        encoded = summary.encode('utf-8')
+        truncated = len(encoded) > METADATA_SUMMARY_MAX_BYTES
+        metadata['summary'] = encoded[:METADATA_SUMMARY_MAX_BYTES].decode('utf-8', errors='ignore') if truncated else summary
+        metadata['summary_truncated'] = truncated
+    return metadata
+
+def cache_memory_docs(docs):
+    expires = time.time() + MEMORY_CACHE_TTL
+    with memory_cache_lock:
+        for doc in docs:
+            memory_cache[doc['_id']] = (expires, doc)
+            memory_cache.move_to_end(doc['_id'])
+        while len(memory_cache) > MEMORY_CACHE_SIZE:
+            memory_cache.popitem(last=False)
+
+def chunked(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def iter_chunks(iterable, size):
+    """리스트로 만들지 않고 size개씩 묶어서 내보냄 (Mongo 커서 스트리밍용)"""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def ensure_indexes():
+    """날짜별 조회(복원, 기억 통합)에 쓰는 인덱스 생성 - 이미 있으면 아무 일도 하지 않음"""
+    mongo_chats_collection.create_index([('date', 1), ('session_id', 1), ('_id', 1)])    # 날짜·세션별 _id 순 스트리밍(iter_chats)을 메모리 정렬 없이
+    mongo_chats_collection.create_index([('session_id', 1), ('date', 1)])
+    mongo_memory_collection.create_index([('date', 1), ('session_id', 1)])
+
+def ingest_memories(docs, cache=None, embed_batch_size=None, upsert_batch_size=None, mongo_batch_size=None, tries=INGEST_TRIES):
+    """기억 문서({'_id', 'date', 'keyword', 'summary'}, 선택 'session_id') 목록을 일괄 저장
+
+    1) 요약을 묶음 단위 다중 입력 임베딩 요청으로 변환
+    2) 벡터를 묶음 단위로 Pinecone에 upsert
+    3) Mongo에는 bulk_write(UpdateOne upsert)로 기록
+    각 묶음은 실패 시 tries 번까지 (지수 백오프로) 재시도한다.
+    """
+    cache = cache or embedding_cache
+    embed_batch_size = embed_batch_size or EMBED_BATCH_SIZE
+    upsert_batch_size = upsert_batch_size or UPSERT_BATCH_SIZE
+    mongo_batch_size = mongo_batch_size or MONGO_BATCH_SIZE
+
+    vectors = []
+    for chunk in chunked(docs, embed_batch_size):
+        vectors.extend(retry_call(cache.embed_many, fargs=[[doc['summary'] for doc in chunk]], tries=tries, delay=2, backoff=2))
+    print(f'> 임베딩 완료: {len(vectors)}개')
+
+    items = [(str(doc['_id']), vector, vector_metadata(doc['date'], doc['keyword'], doc['summary'], doc.get('session_id')))
+             for doc, vector in zip(docs, vectors)]
+    for chunk in chunked(items, upsert_batch_size):
+        retry_call(pinecone_index.upsert, fargs=[chunk], tries=tries, delay=2, backoff=2)
+    print(f'> 벡터 upsert 완료: {len(items)}개')
+
+    for chunk in chunked(docs, mongo_batch_size):
+        operations = [UpdateOne({'_id': doc['_id']}, {'$set': {k: v for k, v in doc.items() if k != '_id'}}, upsert=True)
+                    for doc in chunk]
+        retry_call(mongo_memory_collection.bulk_write, fargs=[operations], fkwargs={'ordered': False}, tries=tries, delay=2, backoff=2)
+        cache_memory_docs(chunk)
+    print(f'> Mongo 저장 완료: {len(docs)}개')
+
+# 후보별 유사도 계산을 병렬로 보낼 때 사용하는 풀 (rerank_mode='parallel' 또는 배치 실패 시)
+filter_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='memory-filter')
+summarize_executor = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix='memory-summarize')
+
+def token_bounded_chunks(items, max_tokens):
+    """dict 목록을 gpt_num_tokens 기준 max_tokens 이하 묶음으로 나눔 (하나가 더 크면 단독 묶음)"""
+    chunk, used = [], 0
+    for item in items:
+        tokens = gpt_num_tokens([item])
+        if chunk and used + tokens > max_tokens:
+            yield chunk
+            chunk, used = [], 0
+        chunk.append(item)
+        used += tokens
+    if chunk:
+        yield chunk
+
+def embed(text):
+    return embedding_cache.embed(text)
+
 # statement1은 기억에 대한 질문입니다.
 # statement2는 브라이언와 테오가 공유하는 기억입니다.
 # statment2는 statement1에 대한 가억으로 적절한지 아래 json 포맷으로 답하세요
@@ -40,6 +232,17 @@ Answer whether statement2 is appropriate as a memory for statement1 in the follo
 {"probability": <between 0 and 1>}
 """
 
+# statement1은 기억에 대한 질문입니다.
+# statements는 브라이언과 테오가 공유하는 기억 목록입니다.
+# statements의 각 항목이 statement1에 대한 기억으로 적절한지 같은 순서로 아래 json 포맷으로 답하세요
+# {'probabilities': [<0과 1 사이의 확률>, ...]}
+MEASURING_SIMILARITY_BATCH_ROLE = """
+statement1 is a question about memory.
+statements is a list of memories shared by '브라이언' and '테오'.
+For each item of statements, answer whether it is appropriate as a memory for statement1, in the same order, in the following JSON format
+{"probabilities": [<between 0 and 1>, ...]}
+"""
+
 SUMMARIZING_TEMPLATE = """
 당신은 사용자의 메시지를 아래의 JSON 형식으로 대화 내용을 주제별로 요약하는 기계입니다.
 1. 주제는 구체적이며 의미가 있는 것이어야 합니다.
@@ -57,27 +260,82 @@ SUMMARIZING_TEMPLATE = """
 }
 """
 
+MERGING_SUMMARIES_TEMPLATE = """
+당신은 같은 날의 대화를 나누어 만든 주제별 부분 요약들을 하나로 합치는 기계입니다.
+1. 입력은 {"주제":<주제>, "요약":<요약>} 목록이며, 같거나 비슷한 주제는 하나로 묶어 요약을 합칩니다.
+2. 요약 내용에는 '브라이언은...', '테오는...'처럼 대화자의 이름이 들어가야 합니다.
+3. 부분 요약의 사실과 표현을 최대한 유지합니다.
+4. 주제의 갯수는 무조건 5개를 넘지 말아야 합니다.
+5. "```json"과 같은 부가 정보를 포함하지 않습니다.
+```
+{
+    "data":
+            [
+                {"주제":<주제>, "요약":<요약>},
+                {"주제":<주제>, "요약":<요약>},
+            ]
+}
+"""
+
 class MemoryManager:
+    _exemplar_vectors = None
+    _exemplar_lock = threading.Lock()
+
     def __init__(self, **kwargs):
         self.user = kwargs['user']
         self.assistant = kwargs['assistant']
+        # 세션 풀에서 만든 인스턴스는 자기 세션의 기억만 검색 (None이면 전체 - 단일 사용자 실행, 기억 통합 워커)
+        self.session_id = kwargs.get('session_id')
+        self.use_embedding_gate = kwargs.get('use_embedding_gate', os.getenv('MEMORY_EMBEDDING_GATE', 'true').lower() == 'true')
+        self.embedding_gate_margin = kwargs.get('embedding_gate_margin', 0.05)
+        # 후보 재순위: 'batch'(한 번의 요청) 또는 'parallel'(후보별 동시 요청)
+        self.rerank_mode = kwargs.get('rerank_mode', 'batch')
+        # 벡터 점수가 이 값 이상이고 2위와 margin 이상 차이 나면 LLM 없이 채택 (None이면 사용 안 함)
+        self.local_rerank_score = kwargs.get('local_rerank_score', None)
+        self.local_rerank_margin = kwargs.get('local_rerank_margin', 0.05)
 
     def search_mongo_db(self, _id):
-        search_result = mongo_memory_collection.find_one({'_id': int(_id)})
+        search_result = self.search_mongo_db_many([_id])[0]
         print('search_result', search_result)
         return search_result['summary']
+
+    def search_mongo_db_many(self, ids):
+        """후보 id들의 기억 문서를 한 번의 $in 조회로 가져옴 (입력 순서 유지, 없는 id는 None)"""
+        ids = [int(_id) for _id in ids]
+        now = time.time()
+        docs = {}
+        with memory_cache_lock:
+            for _id in ids:
+                cached = memory_cache.get(_id)
+                if cached is not None and cached[0] > now:
+                    memory_cache.move_to_end(_id)
+                    docs[_id] = cached[1]
+
+        missing = [_id for _id in ids if _id not in docs]
+        if missing:
+            results = mongo_memory_collection.find(
+                {'_id': {'$in': missing}},
+                {'summary': 1, 'keyword': 1, 'date': 1}
+            )
+            for doc in results:
+                docs[doc['_id']] = doc
+            cache_memory_docs([docs[_id] for _id in missing if _id in docs])
+            print(f'> Mongo 일괄 조회: 요청 {len(missing)}개, 캐시 적중 {len(ids) - len(missing)}개')
+
+        return [docs.get(_id) for _id in ids]
     
     def search_vector_db(self, message, vector_threshold=0.7):
         print('=' * 80)
         print('> [Vector DB 검색]')
         print(f'> 검색 메시지: {message}')
         
-        query_vector = ( 
-            client.embeddings.create(input=message, model=embedding_model).data[0].embedding
-        )
+        query_vector = embed(message)
         print(f'> 임베딩 벡터 생성 완료 (차원: {len(query_vector)})')
         
-        results = pinecone_index.query(top_k=3, vector=query_vector, include_metadata=True)
+        query = {'top_k': 3, 'vector': query_vector, 'include_metadata': True}
+        if self.session_id is not None:
+            query['filter'] = {'session_id': {'$eq': self.session_id}}
+        results = pinecone_index.query(**query)
         print(f'> 검색 결과 수: {len(results["matches"])}')
         
         # 임계값을 통과한 모든 후보 수집
@@ -85,10 +343,15 @@ class MemoryManager:
         for i, match in enumerate(results['matches'], 1):
             print(f'  [{i}] ID: {match["id"]}, Score: {match["score"]:.4f}')
             if 'metadata' in match:
-                print(f'      메타데이터: {match["metadata"]}')
+                print(f'      메타데이터: { {k: v for k, v in match["metadata"].items() if k != "summary"} }')
             
             if match['score'] > vector_threshold:
-                candidates.append({'id': match['id'], 'score': match['score']})
+                candidate = {'id': match['id'], 'score': match['score']}
+                metadata = match.get('metadata') or {}
+                # 메타데이터에 요약 원문이 있으면 Mongo 조회 없이 바로 사용
+                if metadata.get('summary') and not metadata.get('summary_truncated'):
+                    candidate['summary'] = metadata['summary']
+                candidates.append(candidate)
                 print(f'      → 벡터 임계값({vector_threshold}) 통과 ✓')
             else:
                 print(f'      → 벡터 임계값({vector_threshold}) 미달 ✗')
@@ -98,11 +361,15 @@ class MemoryManager:
         return candidates
     
     def filter(self, message, memory, threshhold=0.6):
+        prob = self.measure_similarity(message, memory)
+        print(f'> 임계값({threshhold}) 통과 여부: {"통과 ✓" if prob >= threshhold else "실패 ✗"}')
+        return prob >= threshhold
+
+    def measure_similarity(self, message, memory):
         print('=' * 80)
         print('> [질문과 대화 요약 간 유사도 계산]')
         print(f'> 질문: {message}')
         print(f'> 대화 요약: {memory[:200]}...' if len(memory) > 200 else f'> 대화 요약: {memory}')
-        print(f'> 임계값(threshold): {threshhold}')
         
         try:
             response = client.responses.create(
@@ -117,7 +384,6 @@ class MemoryManager:
             
             prob = json.loads(response_text)['probability']
             print(f'> 계산된 유사도(probability): {prob}')
-            print(f'> 임계값 통과 여부: {"통과 ✓" if prob >= threshhold else "실패 ✗"}')
             
         except Exception as e:
             print(f'> filter error: {e}')
@@ -125,32 +391,96 @@ class MemoryManager:
             print(f'> 에러로 인한 기본값 설정: {prob}')
         
         print('=' * 80)
-        return prob >= threshhold
+        return prob
+
+    def measure_similarities(self, message, memories):
+        """모든 후보의 유사도를 한 번의 요청으로 계산 (rerank_mode='parallel'이거나 배치 응답이 이상하면 후보별 동시 요청)"""
+        if self.rerank_mode == 'batch' and len(memories) > 1:
+            print('=' * 80)
+            print(f'> [질문과 대화 요약 {len(memories)}개 간 유사도 일괄 계산]')
+            try:
+                response = client.responses.create(
+                    model=model.advanced,
+                    input=[
+                        {'role': 'developer', 'content': MEASURING_SIMILARITY_BATCH_ROLE},
+                        {'role': 'user', 'content': json.dumps({'statement1': message, 'statements': memories}, ensure_ascii=False)},
+                    ],
+                )
+                print(f'> API 응답: {response.output_text}')
+                probs = [float(p) for p in json.loads(response.output_text)['probabilities']]
+                if len(probs) == len(memories):
+                    print('=' * 80)
+                    return probs
+                print(f'> 응답 개수 불일치: {len(probs)} != {len(memories)}')
+            except Exception as e:
+                print(f'> batch filter error: {e}')
+            print('> 후보별 동시 요청으로 전환')
+            print('=' * 80)
+
+        return list(filter_executor.map(lambda memory: self.measure_similarity(message, memory), memories))
+
+    def rank_memories(self, message, candidates):
+        """summary가 채워진 후보들을 질문과의 적합도(probability) 내림차순으로 정렬해 반환"""
+        candidates = sorted(candidates, key=lambda c: c['score'], reverse=True)
 
-    def retrieve_memory(self, message):
-        candidates = self.search_vector_db(message)
+        # 로컬 재순위: 벡터 점수가 충분히 높고 2위와 차이가 크면 LLM 호출 없이 결정
+        if self.local_rerank_score is not None:
+            top = candidates[0]['score']
+            runner_up = candidates[1]['score'] if len(candidates) > 1 else 0
+            if top >= self.local_rerank_score and top - runner_up >= self.local_rerank_margin:
+                print(f'> 로컬 재순위로 결정: score={top:.4f}, 2위와 차이={top - runner_up:.4f}')
+                return [{**c, 'probability': c['score']} for c in candidates]
+
+        probs = self.measure_similarities(message, [c['summary'] for c in candidates])
+        ranked = [{**c, 'probability': p} for c, p in zip(candidates, probs)]
+        return sorted(ranked, key=lambda c: c['probability'], reverse=True)
+
+    def retrieve_memory(self, message, candidates=None, threshhold=0.6):
+        # 호출 측에서 벡터 검색을 미리(병렬로) 끝냈다면 그 결과를 그대로 사용
+        if candidates is None:
+            candidates = self.search_vector_db(message)
         if not candidates:
             print('> 벡터 검색 결과 없음')
             return None
 
-        print(f'> {len(candidates)}개 후보에 대해 유사도 필터 검사 시작')
+        print(f'> {len(candidates)}개 후보에 대해 유사도 재순위 시작')
+        # 메타데이터로 채워지지 않은 후보만 Mongo에서 가져옴
+        missing = [c for c in candidates if 'summary' not in c]
+        if missing:
+            docs = self.search_mongo_db_many([c['id'] for c in missing])
+            summaries = {c['id']: doc['summary'] for c, doc in zip(missing, docs) if doc is not None}
+            candidates = [c if 'summary' in c else {**c, 'summary': summaries[c['id']]}
+                          for c in candidates if 'summary' in c or c['id'] in summaries]
+        if not candidates:
+            print('> 후보 문서를 찾을 수 없음')
+            return None
         
-        # 모든 후보를 filter로 검사
-        for i, candidate in enumerate(candidates, 1):
-            print(f'\n> [후보 {i}/{len(candidates)}] ID: {candidate["id"]}, Vector Score: {candidate["score"]:.4f}')
-            memory = self.search_mongo_db(candidate['id'])
-            
-            if self.filter(message, memory):
-                print(f'> ✓ 최종 선택됨: ID={candidate["id"]}')
-                return memory
-            else:
-                print(f'> ✗ 유사도 필터 통과 실패, 다음 후보 검사...')
+        ranked = self.rank_memories(message, candidates)
+        for i, candidate in enumerate(ranked, 1):
+            print(f'  [{i}] ID: {candidate["id"]}, Vector Score: {candidate["score"]:.4f}, Probability: {candidate["probability"]:.4f}')
+
+        best = ranked[0]
+        if best['probability'] >= threshhold:
+            print(f'> ✓ 최종 선택됨: ID={best["id"]}')
+            return best['summary']
         
         print('> 모든 후보가 유사도 필터를 통과하지 못함')
         return None
 
-    def needs_memory(self, message):
+    def needs_memory(self, message, allow_llm=True):
+        """기억이 필요한 질의인지 판단 - allow_llm=False면 로컬에서 판단하지 못한 경우 False"""
         print('> needs_memory check for message:', message)
+
+        # 1차: 로컬 규칙 → 2차: 예시 질의와의 임베딩 유사도 → 그래도 애매한 경우에만 LLM
+        verdict = classify_memory_need(message)
+        if verdict is None and self.use_embedding_gate:
+            verdict = self._embedding_gate(message)
+        if verdict is not None:
+            print('> needs_memory (local):', verdict)
+            return verdict
+        if not allow_llm:
+            return False
+
         try:
             response = client.responses.create(
                 model=model.advanced, 
@@ -164,97 +494,198 @@ class MemoryManager:
             print(f"> needs_memory error: {e}")
             return False
 
-    def save_chat(self, context):      
-        response_context = []  
-        messages = []
-        for message in context:
-            if message.get('saved', True): 
-                response_context.append(message)
-            else:
-                messages.append({'date': today(), 'role': message['role'], 'content': message['content']})
-                message['saved'] = True
-                response_context.append(message)
+    def _embedding_gate(self, message):
+        """기억 질의/일반 질의 예시와의 최대 유사도 차이가 margin 이상이면 판단, 아니면 None"""
         try:
-            if len(messages) > 0:           
-                mongo_chats_collection.insert_many(messages)
+            with MemoryManager._exemplar_lock:
+                if MemoryManager._exemplar_vectors is None:
+                    response = client.embeddings.create(input=MEMORY_EXEMPLARS + NON_MEMORY_EXEMPLARS, model=embedding_model)
+                    vectors = [d.embedding for d in response.data]
+                    MemoryManager._exemplar_vectors = (vectors[:len(MEMORY_EXEMPLARS)], vectors[len(MEMORY_EXEMPLARS):])
+            positives, negatives = MemoryManager._exemplar_vectors
+
+            vector = embed(message)
+            positive = max(cosine_similarity(vector, v) for v in positives)
+            negative = max(cosine_similarity(vector, v) for v in negatives)
+            print(f'> embedding gate: memory={positive:.4f}, general={negative:.4f}')
+            if positive - negative >= self.embedding_gate_margin:
+                return True
+            if negative - positive >= self.embedding_gate_margin:
+                return False
         except Exception as e:
-            pprint(e)
-            return context
+            print(f'> embedding gate error: {e}')
+        return None
+
+    def enqueue_chat(self, message, session_id=None, on_saved=None):
+        """대화 버퍼에 추가된 메시지를 저장 대기열에 넣음 - 저장되면 on_saved()가 호출됨"""
+        doc = {'date': today(), 'role': message.role, 'content': message.content}
+        if session_id is not None:
+            doc['session_id'] = session_id
+        chat_writer.enqueue(doc, on_saved)
 
-        return response_context
+    def save_chat(self, timeout=None):
+        """대기 중인 메시지를 바로 저장하고 최대 timeout초(None이면 ChatWriter 기본 상한) 동안 기다림"""
+        return chat_writer.flush(timeout)
 
-    def restore_chat(self, date=None):
+    def restore_chat(self, date=None, session_id=None):
+        """date(기본 오늘)의 대화를 복원 - session_id가 있으면 그 세션의 대화만 (다른 사용자의 대화가 섞이지 않도록)"""
         search_date = date if date is not None else today()        
-        search_results = mongo_chats_collection.find({'date': search_date})
-        restored_chat = [ {'role': v['role'], 'content': v['content'], 'saved': True} for v in search_results ]
+        query = {'date': search_date}
+        if session_id is not None:
+            query['session_id'] = session_id
+        search_results = mongo_chats_collection.find(query, {'_id': 0, 'role': 1, 'content': 1})
+        restored_chat = [ ChatMessage(v['role'], v['content']) for v in search_results ]
         print(f"Restored {len(restored_chat)} messages from date {search_date}")
         return restored_chat
+
+    def iter_chats(self, date, session_id=None, batch_size=CHAT_READ_BATCH_SIZE):
+        """date의 한 세션 대화(session_id가 None이면 세션 정보가 없는 예전 대화)를 저장 순서대로 batch_size개 이하 묶음으로 읽음"""
+        cursor = mongo_chats_collection.find({'date': date, 'session_id': session_id}, {'_id': 0, 'role': 1, 'content': 1}).sort('_id', 1).batch_size(batch_size)
+        return iter_chunks((ChatMessage(v['role'], v['content']) for v in cursor), batch_size)
+
+    def iter_chat_ids(self, date, batch_size=CHAT_READ_BATCH_SIZE):
+        cursor = mongo_chats_collection.find({'date': date}, {'_id': 1}).batch_size(batch_size)
+        return iter_chunks((str(v['_id']) for v in cursor), batch_size)
+
+    def chat_sessions(self, date):
+        """date에 대화가 있는 세션 목록 (세션 정보가 없는 예전 대화가 있으면 None 포함)"""
+        sessions = [s for s in mongo_chats_collection.distinct('session_id', {'date': date}) if s is not None]
+        if mongo_chats_collection.find_one({'date': date, 'session_id': None}, {'_id': 1}) is not None:
+            sessions.append(None)
+        return sessions
+
+    def has_memory(self, date, session_id=None):
+        return mongo_memory_collection.count_documents({'date': date, 'session_id': session_id}, limit=1) > 0
+
+    def has_chats(self, date):
+        return mongo_chats_collection.find_one({'date': date}, {'_id': 1}) is not None
     
     def summarize(self, messages):
-        altered_messages = [ 
+        """하루 대화를 주제별(5개 이하)로 요약 - 실패하면 빈 목록
+
+        map: 대화를 SUMMARY_CHUNK_TOKENS 크기 묶음으로 나눠 동시에 요약
+        reduce: 부분 요약을 통째로(최소 2개씩) 묶어 합치기를 하나가 남을 때까지 반복 - 단계 수는 log2(묶음 수) 이하
+        """
+        altered_messages = (
             {
                 f"{self.user if message['role'] == 'user' else self.assistant}": message['content'] 
             } for message in messages
-        ]
-        
+        )
+
         try:
-            context = [ {'role': 'developer', 'content': SUMMARIZING_TEMPLATE},
-                        {'role': 'user', 'content': json.dumps(altered_messages, ensure_ascii=False)} ]
+            started = time.time()
+            partials = self._map_summaries(token_bounded_chunks(altered_messages, SUMMARY_CHUNK_TOKENS))
+            if not partials:
+                return []
+            print(f'> summarize: 대화 묶음 {len(partials)}개 요약 ({time.time() - started:.1f}s)')
+
+            while len(partials) > 1:
+                groups = self._merge_groups(partials)
+                partials = list(summarize_executor.map(lambda group: self._summarize_request(MERGING_SUMMARIES_TEMPLATE, group), groups))
+
+            print('> summarize:', partials[0])
+            return partials[0]
+        except Exception as e:
+            print('> Exception:', e)
+            return []
+
+    def _merge_groups(self, partials):
+        """부분 요약을 통째로 묶음 - 예산 안에서 최대한 많이, 최소 2개씩 묶어 매 단계 수가 절반 이하로 줄어들게 함"""
+        groups, group, used = [], [], 0
+        for partial in partials:
+            tokens = gpt_num_tokens(partial)
+            if len(group) >= 2 and used + tokens > SUMMARY_CHUNK_TOKENS:
+                groups.append(group)
+                group, used = [], 0
+            group.append(partial)
+            used += tokens
+        if len(group) == 1 and groups:
+            groups[-1].append(group[0])    # 남은 하나는 앞 묶음에 붙여 단독으로 다음 단계에 넘어가지 않도록
+        elif group:
+            groups.append(group)
+        return [[topic for partial in group for topic in partial] for group in groups]
+
+    def _map_summaries(self, chunks):
+        """묶음들을 동시에 요약하고 순서대로 반환 - 대화 전체를 메모리에 올리지 않도록 진행 중인 묶음 수를 제한"""
+        futures, results = [], []
+        for chunk in chunks:
+            futures.append(summarize_executor.submit(self._summarize_request, SUMMARIZING_TEMPLATE, chunk))
+            if len(futures) >= SUMMARY_WORKERS * 2:
+                results.append(futures.pop(0).result())
+        results.extend(future.result() for future in futures)
+        return results
+
+    def _summarize_request(self, template, items):
+        def request():
+            context = [ {'role': 'developer', 'content': template},
+                        {'role': 'user', 'content': json.dumps(items, ensure_ascii=False)} ]
             response = client.responses.create(
                 model=model.basic,
                 input=context,
             )
-            print('> summarize:', response.output_text)
             return json.loads(response.output_text)['data']
-        except Exception as e:
-            print('> Exception:', e)
-            return []
+        return retry_call(request, tries=SUMMARY_TRIES, delay=2, backoff=2)
 
     def delete_by_date(self, date):
-        search_results = mongo_chats_collection.find({'date': date})
-        ids = [str(v['_id']) for v in search_results]
-        if len(ids) == 0:
-            return
-
-        pinecone_index.delete(ids=ids)
+        for ids in self.iter_chat_ids(date):
+            pinecone_index.delete(ids=ids)
         mongo_chats_collection.delete_many({'date': date})
 
-    def save_to_memory(self, summaries, date):
-        next_id = self.next_memory_id()
+    def delete_memory(self, date):
+        """date의 기억 문서와 벡터를 삭제 (기억을 다시 만들 때)"""
+        ids = [doc['_id'] for doc in mongo_memory_collection.find({'date': date}, {'_id': 1})]
+        for chunk in chunked(ids, UPSERT_BATCH_SIZE):
+            pinecone_index.delete(ids=[str(_id) for _id in chunk])
+        mongo_memory_collection.delete_many({'date': date})
+        with memory_cache_lock:
+            for _id in ids:
+                memory_cache.pop(_id, None)
+        print(f'> {date} 기억 {len(ids)}개 삭제')
 
-        for summary in summaries:
-            vector = client.embeddings.create(
-                input=summary['요약'], 
-                model=embedding_model
-            ).data[0].embedding
-            metadata = {'date': date, 'keyword': summary['주제']}
-            pinecone_index.upsert([(str(next_id), vector, metadata)])
+    def save_to_memory(self, summaries, date, session_id=None):
+        next_id = self.next_memory_id()
+        docs = [{'_id': next_id + i, 'date': date, 'keyword': summary['주제'], 'summary': summary['요약']}
+                for i, summary in enumerate(summaries)]
+        if session_id is not None:
+            for doc in docs:
+                doc['session_id'] = session_id
+        ingest_memories(docs)
 
-            query = {'_id': next_id}  # 조회조건
-            newvalues = {'$set': {'date': date, 'keyword': summary['주제'], 'summary': summary['요약']} }
-            mongo_memory_collection.update_one(query, newvalues, upsert=True)
-            next_id += 1
+    def sync_vector_metadata(self):
+        """Mongo의 기억 문서(원본)를 기준으로 벡터 메타데이터를 다시 씀 (임베딩은 재계산하지 않음)"""
+        count = 0
+        for doc in mongo_memory_collection.find({}, {'summary': 1, 'keyword': 1, 'date': 1, 'session_id': 1}):
+            pinecone_index.update(id=str(doc['_id']), set_metadata=vector_metadata(doc['date'], doc['keyword'], doc['summary'], doc.get('session_id')))
+            count += 1
+        print(f'> 벡터 메타데이터 동기화 완료: {count}개')
 
     def next_memory_id(self):
         result = mongo_memory_collection.find_one(sort=[('_id', -1)])
         return 1 if result is None else result['_id'] + 1
 
-    def build_memory(self):
-        print(f'build_memory started...')
-        date = yesterday()
-        #date = today()    # 테스트 용도
-
-        memory_results = mongo_memory_collection.find({'date': date})
-        if len(list(memory_results)) > 0:
-            return
+    def build_memory(self, date=None):
+        """date(기본 어제)의 대화를 세션별로 요약해 기억으로 저장 - 모든 세션이 성공했거나 이미 처리된 날짜면 True
 
-        chats_results = self.restore_chat(date)
-        if len(list(chats_results)) == 0:
-            return
+        기억에는 session_id가 붙어 그 세션에서만 검색된다 (다른 사용자의 대화가 귓속말로 섞이지 않도록).
+        """
+        date = date if date is not None else yesterday()
+        print(f'build_memory started... ({date})')
 
-        summaries = self.summarize(chats_results)    # 주제별 요약하기
+        if not self.has_chats(date):
+            return True
 
-        self.delete_by_date(date)                    # 날짜별 삭제하기
-
-        self.save_to_memory(summaries, date)         # Database에 저장하기
+        ok = True
+        for session_id in self.chat_sessions(date):
+            if self.has_memory(date, session_id):
+                continue
+            messages = (message for chunk in self.iter_chats(date, session_id) for message in chunk)
+            summaries = self.summarize(messages)                 # 주제별 요약하기
+            if not summaries:
+                ok = False                                       # 요약 실패 시 대화를 지우지 않고 다음 실행에서 재시도
+                continue
+            self.save_to_memory(summaries, date, session_id)     # Database에 저장하기
+        if not ok:
+            return False
 
+        self.delete_by_date(date)                                # 모든 세션 저장이 끝난 뒤 날짜별 삭제하기
+        return True
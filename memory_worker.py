@@ -0,0 +1,141 @@
+"""
+대화 기록을 날짜별 기억으로 통합(consolidation)하는 독립 실행 워커
+
+    python memory_worker.py                  # 체크포인트 이후 통합되지 않은 날짜를 모두 처리하고 종료 (cron 등으로 매일 실행)
+    python memory_worker.py --loop 3600      # 스케줄러 없이 1시간마다 반복
+    python memory_worker.py --date 20251105  # 특정 날짜만 처리 (이미 통합된 날짜는 건너뜀, 체크포인트는 그대로)
+    python memory_worker.py --date 20251105 --force  # 그 날짜의 기억을 지우고 다시 만듦 (대화 기록이 남아 있을 때만)
+
+배포 전체에서 한 번에 하나의 워커만 돌도록 Mongo에 만료 시각이 있는 lease lock을 잡는다.
+"""
+
+import os
+import time
+import uuid
+import socket
+import argparse
+from dotenv import load_dotenv
+
+load_dotenv()
+from pymongo.errors import DuplicateKeyError
+from common import today, currTime
+from memory_manager import MemoryManager, mongo_cluster, mongo_chats_collection, ensure_indexes
+
+state_collection = mongo_cluster['OPENAI_AGENT_CHAT']['memory_state']
+
+LOCK_ID = 'consolidation_lock'
+CHECKPOINT_ID = 'consolidation_checkpoint'
+DEFAULT_LEASE = int(os.getenv('MEMORY_WORKER_LEASE', '1800'))    # 초
+
+
+class LeaseLock:
+    """Mongo 문서 하나로 구현한 lease lock - 워커가 죽어도 lease가 만료되면 다른 워커가 가져감"""
+
+    def __init__(self, collection, name: str, lease: int = DEFAULT_LEASE):
+        self.collection = collection
+        self.name = name
+        self.lease = lease
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+    def acquire(self) -> bool:
+        now = time.time()
+        try:
+            # 만료됐거나 내가 잡은 lock만 갱신, 문서가 없으면 새로 만듦 (다른 워커가 잡고 있으면 _id 중복으로 실패)
+            self.collection.find_one_and_update(
+                {'_id': self.name, '$or': [{'expires_at': {'$lt': now}}, {'owner': self.owner}]},
+                {'$set': {'owner': self.owner, 'expires_at': now + self.lease}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    def renew(self):
+        result = self.collection.update_one(
+            {'_id': self.name, 'owner': self.owner},
+            {'$set': {'expires_at': time.time() + self.lease}}
+        )
+        if result.matched_count == 0:
+            raise RuntimeError('lease를 잃었습니다 (다른 워커가 lock을 가져감)')
+
+    def release(self):
+        self.collection.delete_one({'_id': self.name, 'owner': self.owner})
+
+
+def load_checkpoint():
+    """마지막으로 통합을 끝낸 날짜 (없으면 None)"""
+    doc = state_collection.find_one({'_id': CHECKPOINT_ID})
+    return doc['date'] if doc else None
+
+def save_checkpoint(date):
+    state_collection.update_one({'_id': CHECKPOINT_ID}, {'$set': {'date': date, 'updated_at': currTime()}}, upsert=True)
+
+def pending_dates(since=None, until=None):
+    """since 이후 until 이전(기본 오늘, 진행 중인 날은 제외)까지 대화가 남아 있는 날짜 목록 (오래된 순)"""
+    query = {'$lt': until or today()}
+    if since:
+        query['$gt'] = since
+    return sorted(mongo_chats_collection.distinct('date', {'date': query}))
+
+def consolidate(manager, dates, lock, checkpoint=True):
+    """날짜 순서대로 기억을 만듦 - 실패한 날짜에서 멈춰 체크포인트가 그 날짜를 넘지 않도록 함"""
+    done = 0
+    for date in dates:
+        lock.renew()
+        started = time.time()
+        if not manager.build_memory(date):
+            print(f'> [memory_worker] {date} 통합 실패, 다음 실행에서 재시도')
+            break
+        if checkpoint:
+            save_checkpoint(date)
+        done += 1
+        print(f'> [memory_worker] {date} 통합 완료 ({time.time() - started:.1f}s)')
+    return done
+
+def run_once(args):
+    lock = LeaseLock(state_collection, LOCK_ID, args.lease)
+    if not lock.acquire():
+        print('> [memory_worker] 다른 워커가 실행 중이라 건너뜀')
+        return
+    try:
+        manager = MemoryManager(user=args.user, assistant=args.assistant)
+        if args.date:
+            if args.force:
+                # 통합이 끝난 날짜는 대화 기록이 지워져 있으므로, 기록이 남아 있을 때만 기억을 지우고 다시 만듦
+                if not manager.has_chats(args.date):
+                    print(f'> [memory_worker] {args.date} 대화 기록이 없어 기억을 다시 만들 수 없음')
+                    return
+                manager.delete_memory(args.date)
+            consolidate(manager, [args.date], lock, checkpoint=False)
+            return
+        since = load_checkpoint()
+        dates = pending_dates(since)
+        print(f'> [memory_worker] 체크포인트 {since}, 통합할 날짜 {len(dates)}개: {dates}')
+        consolidate(manager, dates, lock)
+    finally:
+        lock.release()
+
+def main():
+    parser = argparse.ArgumentParser(description='대화 기록을 날짜별 기억(Pinecone + Mongo)으로 통합')
+    parser.add_argument('--date', help='이 날짜(yyyymmdd)만 처리')
+    parser.add_argument('--force', action='store_true', help='--date와 함께: 기존 기억을 지우고 남아 있는 대화로 다시 만듦')
+    parser.add_argument('--loop', type=int, default=0, help='0보다 크면 이 간격(초)마다 반복 실행')
+    parser.add_argument('--lease', type=int, default=DEFAULT_LEASE, help='lock 유지 시간(초)')
+    parser.add_argument('--user', default='브라이언')
+    parser.add_argument('--assistant', default='테오')
+    args = parser.parse_args()
+
+    ensure_indexes()
+    while True:
+        try:
+            run_once(args)
+        except Exception:
+            import traceback; traceback.print_exc()
+            if not args.loop:
+                raise
+        if not args.loop:
+            break
+        time.sleep(args.loop)
+
+if __name__ == '__main__':
+    main()
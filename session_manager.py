@@ -0,0 +1,76 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+
+class SessionManager:
+    """세션 id별 Chatbot 인스턴스를 factory(session_id)로 지연 생성하고 LRU 방식으로 축출하는 세션 풀
+
+    - max_sessions: 동시에 유지할 최대 세션 수
+    - max_total_messages: 모든 세션 컨텍스트 메시지 수의 합 상한 (메모리 상한)
+    - idle_timeout: 이 시간(초) 동안 요청이 없던 세션은 축출
+    세션의 메시지는 추가될 때 이미 저장 대기열(ChatWriter)에 들어가므로 축출 시 따로 저장하지 않는다.
+    """
+
+    def __init__(self, factory: Callable, max_sessions: int = 100, max_total_messages: int = 20000, idle_timeout: int = 1800):
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.max_total_messages = max_total_messages
+        self.idle_timeout = idle_timeout
+        self.sessions = OrderedDict()    # session_id -> [chatbot, last_access], 오래된 순서
+        self.lock = threading.Lock()
+        self._creating = {}              # session_id -> 생성 중 잠금 (같은 세션의 중복 생성 방지)
+
+    def get(self, session_id: str):
+        """세션의 Chatbot을 반환하며, 없으면 새로 만든다"""
+        with self.lock:
+            entry = self.sessions.get(session_id)
+            if entry is not None:
+                entry[1] = time.time()
+                self.sessions.move_to_end(session_id)
+                return entry[0]
+            creating = self._creating.setdefault(session_id, threading.Lock())
+
+        # Chatbot 생성은 느리므로(대화 복원, Assistant 스레드 생성) 전역 잠금 밖에서 수행
+        with creating:
+            with self.lock:
+                entry = self.sessions.get(session_id)
+            if entry is None:
+                print(f'> [SessionManager] 새 세션 생성: {session_id}')
+                chatbot = self.factory(session_id)
+                with self.lock:
+                    self.sessions[session_id] = [chatbot, time.time()]
+                    self._creating.pop(session_id, None)
+            else:
+                chatbot = entry[0]
+
+        self.evict()
+        return chatbot
+
+    def evict(self):
+        """유휴 시간 초과 및 상한 초과 세션을 LRU 순서로 축출"""
+        evicted = []
+        now = time.time()
+        with self.lock:
+            total_messages = sum(len(chatbot.context) for chatbot, _ in self.sessions.values())
+            while self.sessions:
+                session_id, (chatbot, last_access) = next(iter(self.sessions.items()))
+                # 마지막 남은(방금 사용한) 세션은 상한 때문에 축출하지 않음 - 매 요청 재생성 방지
+                over_limit = len(self.sessions) > 1 and (len(self.sessions) > self.max_sessions or total_messages > self.max_total_messages)
+                if not over_limit and now - last_access <= self.idle_timeout:
+                    break
+                self.sessions.popitem(last=False)
+                total_messages -= len(chatbot.context)
+                evicted.append((session_id, chatbot))
+
+        for session_id, chatbot in evicted:
+            print(f'> [SessionManager] 세션 축출: {session_id}')
+
+    def close(self):
+        """모든 세션을 비움 (서버 종료 시, 대화 저장은 ChatWriter.close()가 담당)"""
+        with self.lock:
+            self.sessions.clear()
+
+    def __len__(self):
+        return len(self.sessions)
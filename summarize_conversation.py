@@ -1,5 +1,10 @@
+import os
 import json
-from retry import retry
+import time
+import random
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import openai
 
 from common import client, model
 
@@ -20,38 +25,100 @@ system_role = """
 }
 """
 
-with open('대화원천내용.json', 'r', encoding='utf-8') as f:
-    conversations = json.load(f)
-
-summaries = []
-
-@retry(tries=5, delay=2)
-def summarize(conversation):
-    try:
-        conversation_str = json.dumps(conversation, ensure_ascii=False)
-        message = [
-            {'role': 'developer', 'content': system_role},
-            {'role': 'user', 'content': conversation_str}
-        ]
-        response = client.responses.create(
-                    model=model.basic, 
-                    input=message,
-                )
-        content = response.output_text
-        print(content)
-
-        # JSON 로드
-        summary = json.loads(content)
-        summaries.append(summary['data'])
-        
-    except Exception as e:
-        print('예외 발생, 재시도합니다.')
-        raise e
-
-for conversation in conversations:
-    summarize(conversation)
-
-# conversations 리스트를 JSON 파일로 저장
-with open('대화내용요약.json', 'w', encoding='utf-8') as f:
-    json.dump(summaries, f, ensure_ascii=False, indent=4)
+def parse_args():
+    parser = argparse.ArgumentParser(description='대화원천내용.json의 대화를 주제별로 병렬 요약')
+    parser.add_argument('--input', default='대화원천내용.json')
+    parser.add_argument('--output', default='대화내용요약.json')
+    parser.add_argument('--checkpoint', default='대화내용요약.checkpoint.jsonl', help='완료된 요약을 한 줄씩 기록, 재실행 시 이어서 진행')
+    parser.add_argument('--concurrency', type=int, default=8, help='동시에 보내는 요청 수')
+    parser.add_argument('--tries', type=int, default=5)
+    return parser.parse_args()
 
+def backoff_delay(e, attempt):
+    """재시도 대기 시간 - 429(rate limit)는 서버가 알려준 retry-after를 우선 사용"""
+    if isinstance(e, openai.RateLimitError):
+        retry_after = getattr(getattr(e, 'response', None), 'headers', {}).get('retry-after')
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return min(60, 4 * 2 ** attempt) + random.uniform(0, 1)
+    return min(30, 2 * 2 ** attempt) + random.uniform(0, 1)
+
+def summarize(conversation, tries=5):
+    conversation_str = json.dumps(conversation, ensure_ascii=False)
+    message = [
+        {'role': 'developer', 'content': system_role},
+        {'role': 'user', 'content': conversation_str}
+    ]
+    for attempt in range(tries):
+        try:
+            response = client.responses.create(
+                        model=model.basic, 
+                        input=message,
+                    )
+            content = response.output_text
+            print(content)
+
+            # JSON 로드
+            return json.loads(content)['data']
+            
+        except Exception as e:
+            if attempt == tries - 1:
+                raise e
+            delay = backoff_delay(e, attempt)
+            print(f'예외 발생({type(e).__name__}), {delay:.1f}초 후 재시도합니다.')
+            time.sleep(delay)
+
+def load_checkpoint(path):
+    """체크포인트 파일에서 이미 끝난 요약을 {인덱스: 요약} 으로 읽음"""
+    done = {}
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    done[record['index']] = record['data']
+                except (json.JSONDecodeError, KeyError):
+                    continue    # 중단 시 마지막 줄이 깨져 있을 수 있음
+    return done
+
+def main():
+    args = parse_args()
+
+    with open(args.input, 'r', encoding='utf-8') as f:
+        conversations = json.load(f)
+
+    summaries = load_checkpoint(args.checkpoint)
+    pending = [i for i in range(len(conversations)) if i not in summaries]
+    print(f'전체 {len(conversations)}개 중 {len(summaries)}개 완료, {len(pending)}개 요약 시작')
+
+    # 완료 처리는 메인 스레드에서만 하므로 체크포인트 쓰기에 별도 잠금이 필요 없음
+    with open(args.checkpoint, 'a', encoding='utf-8') as checkpoint, \
+         ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = {executor.submit(summarize, conversations[i], args.tries): i for i in pending}
+        failed = []
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                data = future.result()
+            except Exception as e:
+                print(f'{i}번째 대화 요약 실패: {e}')
+                failed.append(i)
+                continue
+            summaries[i] = data
+            checkpoint.write(json.dumps({'index': i, 'data': data}, ensure_ascii=False) + '\n')
+            checkpoint.flush()
+
+    if failed:
+        print(f'실패한 대화 {sorted(failed)} - 다시 실행하면 이어서 진행합니다.')
+        return
+
+    # 입력 순서대로 JSON 파일로 저장
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump([summaries[i] for i in range(len(conversations))], f, ensure_ascii=False, indent=4)
+    os.remove(args.checkpoint)
+
+if __name__ == '__main__':
+    main()
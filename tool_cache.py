@@ -0,0 +1,97 @@
+import functools
+import inspect
+import json
+import threading
+import time
+from collections import OrderedDict
+
+def is_cacheable(result):
+    """도구가 명시적으로 실패를 알린 결과('error' 키 또는 'ok': False)는 캐시하지 않음
+    (잠깐의 네트워크 오류가 TTL 동안 굳지 않도록)"""
+    if not isinstance(result, dict) or 'error' in result:
+        return False
+    return result.get('ok', True) is not False
+
+def normalize(value):
+    """캐시 키용 인자 정규화 - 문자열은 공백 정리와 소문자화"""
+    if isinstance(value, str):
+        return ' '.join(value.split()).lower()
+    return value
+
+
+class TTLCache:
+    """키마다 만료 시각이 있는 LRU 캐시
+
+    같은 키로 동시에 들어온 호출은 하나만 실제로 실행하고 나머지는 그 결과를 기다린다(single-flight).
+    """
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()    # key -> (만료 시각, 결과)
+        self.inflight = {}              # key -> (완료 이벤트, 결과를 담을 dict)
+        self.lock = threading.Lock()
+
+    def get_or_call(self, key, ttl, fn, cacheable=is_cacheable):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                self.entries.move_to_end(key)
+                return entry[1]
+            flight = self.inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = (threading.Event(), {})
+                self.inflight[key] = flight
+
+        done, box = flight
+        if not leader:
+            done.wait()
+            if 'error' in box:
+                raise box['error']
+            return box['result']
+
+        store = False
+        try:
+            result = fn()
+            box['result'] = result
+            try:
+                store = cacheable(result)
+            except Exception as e:
+                print(f'> [TTLCache] cacheable 판단 오류, 캐시하지 않음: {e}')
+        except Exception as e:
+            box['error'] = e
+            raise
+        finally:
+            # 어떤 경우에도 inflight를 정리하고 기다리는 호출을 깨움 (안 그러면 같은 키의 호출이 영원히 대기)
+            try:
+                with self.lock:
+                    if store:
+                        self.entries[key] = (time.time() + ttl, box['result'])
+                        self.entries.move_to_end(key)
+                        while len(self.entries) > self.max_entries:
+                            self.entries.popitem(last=False)
+                    self.inflight.pop(key, None)
+            finally:
+                done.set()
+        return result
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+tool_cache = TTLCache()
+
+def cached_tool(fn, ttl, cacheable=is_cacheable, cache=tool_cache):
+    """함수 호출 결과를 ttl초 동안 캐시하는 래퍼 - 기본값을 채운 정규화된 인자를 키로 사용"""
+    signature = inspect.signature(fn)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = {name: normalize(value) for name, value in bound.arguments.items()}
+        key = f'{fn.__name__}:{json.dumps(arguments, ensure_ascii=False, sort_keys=True)}'
+        return cache.get_or_call(key, ttl, lambda: fn(*args, **kwargs), cacheable)
+
+    return wrapper
@@ -0,0 +1,43 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from function_tools import FUNCTION_MAP
+
+# 한 턴에 여러 함수 호출(날씨 + 뉴스 + 주가 등)이 오면 동시에 실행하기 위한 공용 풀
+tool_pool = ThreadPoolExecutor(max_workers=int(os.getenv('TOOL_WORKERS', '8')), thread_name_prefix='tool')
+
+DEFAULT_TOOL_TIMEOUT = 20    # 초
+TOOL_TIMEOUTS = {
+    'get_current_time': 2,
+    'search_web': 30,
+}
+
+def run_tool(name, arguments):
+    """FUNCTION_MAP의 함수를 실행 - 예외는 {'error': ...} 결과로 바꿔서 반환"""
+    print(f"Executing function: {name} with arguments: {arguments}")
+    try:
+        if name in FUNCTION_MAP:
+            return FUNCTION_MAP[name](**arguments)
+        return {"error": "Function not found"}
+    except Exception as e:
+        return {"error": str(e)}
+
+def execute_tool_calls(calls):
+    """(함수 이름, 인자) 목록을 풀에서 동시에 실행하고 호출 순서대로 결과를 반환
+
+    각 함수는 시작 시점부터 TOOL_TIMEOUTS(없으면 DEFAULT_TOOL_TIMEOUT) 안에 끝나야 하며,
+    넘으면 취소를 시도하고 타임아웃 오류를 결과로 돌려준다. 한 턴의 대기 시간은 가장 느린 함수 하나만큼이다.
+    """
+    started = time.time()
+    futures = [tool_pool.submit(run_tool, name, arguments) for name, arguments in calls]
+    results = []
+    for (name, _), future in zip(calls, futures):
+        timeout = TOOL_TIMEOUTS.get(name, DEFAULT_TOOL_TIMEOUT)
+        try:
+            results.append(future.result(timeout=max(0, started + timeout - time.time())))
+        except TimeoutError:
+            # 아직 시작하지 않았다면 취소됨, 실행 중인 함수는 자체 요청 타임아웃으로 끝남
+            future.cancel()
+            print(f"Function timeout: {name} ({timeout}s)")
+            results.append({"error": f"{name} 실행 시간이 {timeout}초를 넘었습니다."})
+    return results